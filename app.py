@@ -1,22 +1,80 @@
 # app.py
 from flask import Flask, render_template, request, Response, jsonify
-import requests
 import xml.etree.ElementTree as ET
-import time
 import json
 import heapq
-from typing import List, Dict, Tuple
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple
 import getpass
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+
+import ahocorasick
+import numpy as np
+
+import metrics
+from bm25 import BM25Index
+from corpus import Corpus, column, field_value, snapshot_version
+from eutils import TRANSIENT_ERRORS, EutilsClient, IncompleteResponse, ResponseCache, TokenBucket, retry
+from paper_store import PaperStore
+from ranking import MAX_PAGE_SIZE, IngestScores, InvalidCursor, Ranking, decode_cursor, encode_cursor
 
 
 # ---------------------------
 # PubMed Query Configuration
 # ---------------------------
 BATCH_SIZE = 10000
-DELAY_BETWEEN_REQUESTS = 3
+EUTILS_BASE_URL = os.environ.get("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+# NCBI allows 3 requests/second without an API key and 10 with one.
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY")
+REQUESTS_PER_SECOND = 10 if NCBI_API_KEY else 3
+# On-disk cache of compressed E-utilities responses; set EUTILS_CACHE_DIR="" to disable.
+EUTILS_CACHE_DIR = os.environ.get("EUTILS_CACHE_DIR", ".eutils_cache")
+EUTILS_CACHE_TTL = int(os.environ.get("EUTILS_CACHE_TTL", 3600))
+EUTILS_CACHE_MAX_BYTES = int(os.environ.get("EUTILS_CACHE_MAX_BYTES", 1 << 30))
+# Number of journals fetched in parallel by stream_pubmed_query
+FETCH_WORKERS = 4
+# Report parsing progress every this many articles
+PROGRESS_INTERVAL = 500
+# While a query runs, report its best LIVE_TOP_N papers so far (by keyword score
+# with default_keywords) whenever they change, at most every LIVE_TOP_INTERVAL seconds.
+LIVE_TOP_N = 5
+LIVE_TOP_INTERVAL = 5.0
+# esearch returns at most this many IDs; larger result sets are paged through the history server.
+ESEARCH_MAX_IDS = 10000
+# Failed E-utilities calls are retried FETCH_RETRIES times with exponential backoff
+# starting at FETCH_BACKOFF_SECONDS. An efetch batch that still fails is split in
+# half, down to MIN_BATCH_SIZE records, and each half is fetched the same way.
+FETCH_RETRIES = 3
+FETCH_BACKOFF_SECONDS = 1.0
+MIN_BATCH_SIZE = 100
+
+# Shared E-utilities client: pooled session, rate limiter and response cache
+eutils_client = EutilsClient(
+    EUTILS_BASE_URL,
+    TokenBucket(REQUESTS_PER_SECOND),
+    cache=ResponseCache(EUTILS_CACHE_DIR, ttl=EUTILS_CACHE_TTL, max_bytes=EUTILS_CACHE_MAX_BYTES) if EUTILS_CACHE_DIR else None,
+    api_key=NCBI_API_KEY,
+    pool_size=FETCH_WORKERS
+)
+
+# Persistent PubMed article store (SQLite), shared across queries and restarts
+PAPER_STORE_PATH = os.environ.get("PAPER_STORE_PATH", "papers.db")
+paper_store = PaperStore(PAPER_STORE_PATH)
 
-# Global variable to store PubMed articles (in memory)
-papers_data = []
+# Snapshot of the most recent query's corpus. Every gunicorn worker maps the same
+# file read-only, so each sees the latest query and they share one copy of it in
+# memory. Set CORPUS_SNAPSHOT_PATH="" to keep the corpus in process memory only.
+CORPUS_SNAPSHOT_PATH = os.environ.get("CORPUS_SNAPSHOT_PATH", "corpus.snapshot")
+
+# Articles covered by the most recent query, loaded from paper_store
+papers_data = Corpus()
 
 # Global variable to store API key
 api_key = None
@@ -96,41 +154,206 @@ combinations = {
     ('prognostic', 'signature'): 3,
 }
 
+class KeywordScorer:
+    """
+    Single-pass keyword scorer. Every keyword and combination term is compiled
+    into one Aho-Corasick automaton, so an abstract is scanned once instead of
+    once per keyword. Scores are identical to the old per-keyword str.count loop:
+    occurrences of the same term are counted without overlap, left to right.
+    """
+
+    def __init__(self, keywords: List[str]):
+        # Keywords may repeat (e.g. "RNA" and "rna"); fold them into one weight.
+        self.weights = {}
+        for keyword in keywords:
+            keyword_lower = keyword.lower()
+            self.weights[keyword_lower] = self.weights.get(keyword_lower, 0) + keyword_weights.get(keyword_lower, 1)
+        self.combinations = list(combinations.items())
+        terms = set(self.weights)
+        for keyword1, keyword2 in combinations:
+            terms.update((keyword1, keyword2))
+        # str.count("") is len + 1, which the automaton cannot express.
+        terms.discard("")
+        self.automaton = ahocorasick.Automaton()
+        for term in terms:
+            self.automaton.add_word(term, (term, len(term)))
+        self.automaton.make_automaton()
+
+    def counts(self, abstract_lower: str) -> Dict[str, int]:
+        counts = {}
+        next_free = {}
+        for end, (term, length) in self.automaton.iter(abstract_lower):
+            start = end - length + 1
+            if start >= next_free.get(term, 0):
+                counts[term] = counts.get(term, 0) + 1
+                next_free[term] = end + 1
+        counts[""] = len(abstract_lower) + 1
+        return counts
+
+    def score(self, abstract: str) -> int:
+        counts = self.counts(abstract.lower())
+        score = 0
+        for keyword, weight in self.weights.items():
+            score += counts.get(keyword, 0) * weight
+        for (keyword1, keyword2), multiplier in self.combinations:
+            count1 = counts.get(keyword1, 0)
+            count2 = counts.get(keyword2, 0)
+            if count1 and count2:
+                score += min(count1, count2) * multiplier
+        return score
+
+
+@lru_cache(maxsize=32)
+def _compiled_scorer(keywords: Tuple[str, ...]) -> KeywordScorer:
+    return KeywordScorer(list(keywords))
+
+
+def get_keyword_scorer(keywords: List[str]) -> KeywordScorer:
+    """Return the compiled scorer for a keyword list, building it on first use."""
+    if isinstance(keywords, str) or not all(isinstance(keyword, str) for keyword in keywords):
+        raise TypeError("keywords must be a list of strings")
+    return _compiled_scorer(tuple(keywords))
+
+
 def calculate_relevance_score(abstract: str, keywords: List[str]) -> int:
-    abstract_lower = abstract.lower()
-    score = 0
-    for keyword in keywords:
-        keyword_lower = keyword.lower()
-        count = abstract_lower.count(keyword_lower)
-        weight = keyword_weights.get(keyword_lower, 1)
-        score += count * weight
-    for (keyword1, keyword2), multiplier in combinations.items():
-        if keyword1 in abstract_lower and keyword2 in abstract_lower:
-            base_score = min(abstract_lower.count(keyword1), abstract_lower.count(keyword2))
-            score += base_score * multiplier
-    return score
-
-
-def find_top_relevant_papers_from_data(papers: List[Dict],
-                                       keywords: List[str],
-                                       scoring_method: str = "keyword",
-                                       api_key: str = None,
-                                       top_n: int = 5) -> List[Tuple[float, str, str]]:
+    return get_keyword_scorer(keywords).score(abstract)
+
+
+def rank_paper_records(papers,
+                       keywords: List[str],
+                       scoring_method: str = "keyword",
+                       top_n: int = 5) -> List[Tuple[float, Dict]]:
+    """Return (score, paper) pairs for the top_n papers (a Corpus or list of dicts), best first."""
+    with metrics.RANK_SECONDS.time(method=scoring_method):
+        return _rank_paper_records(papers, keywords, scoring_method, top_n)
+
+def _rank_paper_records(papers, keywords, scoring_method, top_n):
+    if scoring_method == "bm25":
+        index, rows = get_bm25_index(papers)
+        return [(score, papers[rows[row]]) for row, score in index.top_n(keywords, top_n, boosts=keyword_weights)]
     top_papers = []
-    for paper in papers:
-        abstract = paper.get('abstract', '')
-        title = paper.get('title', '')
+    ranking = cached_ranking(papers, scoring_method, keywords) if top_n > 0 else None
+    if ranking is not None:
+        # Scores are precomputed (e.g. while the query ran). Only papers scoring at least
+        # the top_n-th best score can make the list; feeding just those, in corpus order,
+        # through the heap below breaks ties exactly as a full scan would.
+        if len(ranking):
+            threshold = ranking.scores[min(top_n, len(ranking)) - 1]
+            count = int(np.searchsorted(-ranking.scores, -threshold, side="right"))
+            order = np.argsort(ranking.positions[:count], kind="stable")
+            for position, final_score in zip(ranking.positions[order].tolist(), ranking.scores[order].tolist()):
+                _push_top(top_papers, top_n, final_score, papers, position, field_value(papers, position, 'abstract'))
+        return [(entry[0], papers[entry[3]]) for entry in sorted(top_papers, reverse=True)]
+    scorer = get_keyword_scorer(keywords)
+    for position, abstract in enumerate(column(papers, 'abstract')):
         if not abstract:
             continue
         if scoring_method == "keyword":
-            final_score = calculate_relevance_score(abstract, keywords) / 100.0
+            final_score = scorer.score(abstract) / 100.0
         # else:  # For "claude" method
         #     final_score = calculate_claude_relevance_score(abstract, api_key)
-        if len(top_papers) < top_n:
-            heapq.heappush(top_papers, (final_score, title, abstract))
-        elif final_score > top_papers[0][0]:
-            heapq.heapreplace(top_papers, (final_score, title, abstract))
-    return sorted(top_papers, reverse=True)
+        _push_top(top_papers, top_n, final_score, papers, position, abstract)
+    return [(entry[0], papers[entry[3]]) for entry in sorted(top_papers, reverse=True)]
+
+def _push_top(top_papers, top_n, final_score, papers, position, abstract):
+    # Titles only break ties, so they are read just for papers entering the heap.
+    if len(top_papers) < top_n:
+        heapq.heappush(top_papers, (final_score, field_value(papers, position, 'title'), abstract, position))
+    elif final_score > top_papers[0][0]:
+        heapq.heapreplace(top_papers, (final_score, field_value(papers, position, 'title'), abstract, position))
+
+def find_top_relevant_papers_from_data(papers,
+                                       keywords: List[str],
+                                       scoring_method: str = "keyword",
+                                       api_key: str = None,
+                                       top_n: int = 5) -> List[Tuple[float, str, str]]:
+    return [(score, paper.get('title', ''), paper['abstract'])
+            for score, paper in rank_paper_records(papers, keywords, scoring_method, top_n)]
+
+# BM25 index for the most recently ranked corpus: (papers list, its length, index, row -> paper position)
+_bm25_cache = None
+
+def get_bm25_index(papers) -> Tuple[BM25Index, List[int]]:
+    """
+    Return a BM25 index over the papers that have an abstract, plus the position of
+    each indexed row in `papers`. The index is built once and reused until a
+    different (or grown) papers list is ranked.
+    """
+    global _bm25_cache
+    cached = _bm25_cache
+    hit = cached is not None and cached[0] is papers and cached[1] == len(papers)
+    metrics.cache_lookup("bm25_index", hit)
+    if hit:
+        return cached[2], cached[3]
+    rows = []
+
+    def indexed_abstracts():
+        for i, abstract in enumerate(column(papers, 'abstract')):
+            if abstract:
+                rows.append(i)
+                yield abstract
+    index = BM25Index(indexed_abstracts())
+    _bm25_cache = (papers, len(papers), index, rows)
+    return index, rows
+
+# Precomputed rankings of one corpus (papers_data), by (scoring method, keywords).
+# They are dropped when a query replaces papers_data.
+RANKING_CACHE_SIZE = 8
+_rankings = OrderedDict()
+_rankings_corpus = None
+_rankings_lock = threading.Lock()
+
+def score_corpus(papers: Corpus, keywords: List[str], scoring_method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Score every paper with an abstract. Returns (corpus positions, scores)."""
+    if scoring_method == "bm25":
+        index, rows = get_bm25_index(papers)
+        return np.asarray(rows, dtype=np.int64), index.score(keywords, boosts=keyword_weights).astype(np.float64)
+    scorer = get_keyword_scorer(keywords)
+    rows = []
+    scores = []
+    for position, abstract in enumerate(papers.column('abstract')):
+        if abstract:
+            rows.append(position)
+            scores.append(scorer.score(abstract) / 100.0)
+    return np.asarray(rows, dtype=np.int64), np.asarray(scores, dtype=np.float64)
+
+def cached_ranking(papers, scoring_method: str, keywords: List[str]) -> Optional[Ranking]:
+    """Return the ranking of `papers` for a scoring method and keyword list if one is cached, else None."""
+    key = (scoring_method, tuple(keywords))
+    with _rankings_lock:
+        if _rankings_corpus is not papers:
+            return None
+        ranking = _rankings.get(key)
+        if ranking is not None:
+            _rankings.move_to_end(key)
+    return ranking
+
+def cache_ranking(scoring_method: str, keywords: List[str], ranking: Ranking):
+    """
+    Keep `ranking` for reuse. A ranking of the current papers_data replaces those of
+    an earlier corpus; one of an outdated corpus is not kept.
+    """
+    global _rankings_corpus
+    with _rankings_lock:
+        if _rankings_corpus is not ranking.corpus:
+            if ranking.corpus is not papers_data:
+                return
+            _rankings.clear()
+            _rankings_corpus = ranking.corpus
+        _rankings[(scoring_method, tuple(keywords))] = ranking
+        if len(_rankings) > RANKING_CACHE_SIZE:
+            _rankings.popitem(last=False)
+
+def get_ranking(papers: Corpus, scoring_method: str, keywords: List[str]) -> Ranking:
+    """Return the sorted ranking of `papers` for a scoring method and keyword list, scoring it on first use."""
+    ranking = cached_ranking(papers, scoring_method, keywords)
+    metrics.cache_lookup("ranking", ranking is not None)
+    if ranking is not None:
+        return ranking
+    with metrics.RANK_SECONDS.time(method=scoring_method):
+        ranking = Ranking(papers, *score_corpus(papers, keywords, scoring_method))
+    cache_ranking(scoring_method, keywords, ranking)
+    return ranking
 
 # Define the list of keywords (as provided)
 default_keywords = [
@@ -151,10 +374,27 @@ default_keywords = [
     "low risk group", "immune-related genes", "mRNA expression profiles"
 ]
 
-def rank_papers(top_n: int) -> str:
+def load_papers_data() -> Corpus:
+    """
+    Return papers_data, first mapping the corpus snapshot if a query in any worker
+    has replaced it. Without a snapshot, after a restart, load whatever earlier
+    queries left in the store.
+    """
+    global papers_data
+    if CORPUS_SNAPSHOT_PATH:
+        version = snapshot_version(CORPUS_SNAPSHOT_PATH)
+        if version is not None and version != papers_data.version:
+            papers_data = Corpus.open(CORPUS_SNAPSHOT_PATH)
+    if not papers_data:
+        papers_data = Corpus.from_papers(paper_store.iter_all_papers())
+    return papers_data
+
+def rank_papers(top_n: int, scoring_method: str = "keyword", keywords: List[str] = None) -> str:
+    load_papers_data()
     if not papers_data:
         return "No papers data available. Please run the PubMed query first."
-    top_papers = find_top_relevant_papers_from_data(papers_data, default_keywords, scoring_method="keyword", top_n=top_n)
+    top_papers = find_top_relevant_papers_from_data(papers_data, keywords or default_keywords,
+                                                    scoring_method=scoring_method, top_n=top_n)
     result_lines = []
     result_lines.append(f"Top {top_n} Relevant Papers:")
     result_lines.append("-" * 50)
@@ -171,8 +411,23 @@ def rank_papers(top_n: int) -> str:
 # ---------------------------
 # PubMed Query Functions
 # ---------------------------
-def fetch_pubmed_ids(query, retmax=100000):
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+# Elements every esearch response must have; esearch reports errors such as a malformed
+# term or a backend failure as a 200 with an <ERROR> body.
+ESEARCH_REQUIRED = ("Count", "WebEnv", "QueryKey")
+
+def count_pubmed_ids(query):
+    """Run esearch for the result count and history-server handles only, without the ID list."""
+    params = {
+        "db": "pubmed",
+        "term": query,
+        "retmode": "xml",
+        "retmax": 0,
+        "usehistory": "y"
+    }
+    root = eutils_client.fetch_xml("esearch.fcgi", params, required=ESEARCH_REQUIRED)
+    return root.find("WebEnv").text, root.find("QueryKey").text, int(root.find("Count").text)
+
+def fetch_pubmed_ids(query, retmax=ESEARCH_MAX_IDS):
     params = {
         "db": "pubmed",
         "term": query,
@@ -180,8 +435,7 @@ def fetch_pubmed_ids(query, retmax=100000):
         "retmax": retmax,
         "usehistory": "y"
     }
-    response = requests.get(base_url, params=params)
-    root = ET.fromstring(response.text)
+    root = eutils_client.fetch_xml("esearch.fcgi", params, required=ESEARCH_REQUIRED)
     count = int(root.find("Count").text)
     webenv = root.find("WebEnv").text
     query_key = root.find("QueryKey").text
@@ -189,8 +443,28 @@ def fetch_pubmed_ids(query, retmax=100000):
     id_list = [id_elem.text for id_elem in id_list_elem.findall("Id")]
     return webenv, query_key, count, id_list
 
+def fetch_history_ids(webenv, query_key, retstart, retmax):
+    """
+    List the PMIDs of records [retstart, retstart + retmax) of a history-server result
+    set (efetch rettype=uilist), which unlike esearch is not capped at ESEARCH_MAX_IDS.
+    """
+    params = {
+        "db": "pubmed",
+        "query_key": query_key,
+        "WebEnv": webenv,
+        "retstart": retstart,
+        "retmax": retmax,
+        "rettype": "uilist",
+        "retmode": "xml"
+    }
+    with eutils_client.open("efetch.fcgi", params) as body:
+        ids = [id_elem.text for id_elem in ET.parse(body).getroot().iter("Id")]
+        if len(ids) < retmax:
+            raise IncompleteResponse(f"uilist returned {len(ids)} of {retmax} PMIDs from {retstart}")
+        body.mark_valid()
+    return ids
+
 def fetch_articles_as_xml(webenv, query_key, retstart=0, retmax=10000):
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
     params = {
         "db": "pubmed",
         "query_key": query_key,
@@ -200,84 +474,588 @@ def fetch_articles_as_xml(webenv, query_key, retstart=0, retmax=10000):
         "rettype": "abstract",
         "retmode": "xml"
     }
-    response = requests.get(base_url, params=params)
-    return response.text
+    return eutils_client.fetch_text("efetch.fcgi", params)
+
+def article_to_json(article):
+    """Convert one <PubmedArticle> element to an article dict, or None if it is not a journal article."""
+    pmid_elem = article.find(".//PMID")
+    pmid = pmid_elem.text if pmid_elem is not None else ""
+    title_elem = article.find(".//ArticleTitle")
+    title = title_elem.text if title_elem is not None else ""
+    abstract_elems = article.findall(".//AbstractText")
+    abstract_text_parts = []
+    for elem in abstract_elems:
+        abstract_text_parts.append("".join(elem.itertext()))
+    abstract_text = " ".join(abstract_text_parts)
+    journal_elem = article.find(".//Journal/Title")
+    journal = journal_elem.text if journal_elem is not None else ""
+    year_elem = article.find(".//JournalIssue/PubDate/Year")
+    pub_year = year_elem.text if year_elem is not None else ""
+    author_elems = article.findall(".//AuthorList/Author")
+    authors = []
+    for auth in author_elems:
+        last_name = auth.find("LastName")
+        fore_name = auth.find("ForeName")
+        name = ""
+        if last_name is not None:
+            name += last_name.text
+        if fore_name is not None:
+            name += ", " + fore_name.text
+        if name:
+            authors.append(name)
+    pub_types = article.findall(".//PublicationTypeList/PublicationType")
+    pub_type_strings = [pt.text for pt in pub_types if pt.text]
+    if "Journal Article" not in pub_type_strings:
+        return None
+    return {
+        "pmid": pmid,
+        "title": title,
+        "abstract": abstract_text,
+        "journal": journal,
+        "publication_year": pub_year,
+        "authors": authors
+    }
+
+def iter_pubmed_articles(source, rejected=None):
+    """
+    Incrementally parse PubMed efetch XML from a file-like object and yield article dicts.
+    Each <PubmedArticle> is cleared from the tree once converted, so memory stays flat
+    regardless of how many records the source holds. The PMIDs of records that are not
+    journal articles are appended to `rejected`, if given.
+    """
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag not in ("PubmedArticle", "PubmedBookArticle"):
+            continue
+        article_dict = article_to_json(elem) if elem.tag == "PubmedArticle" else None
+        if article_dict is not None:
+            yield article_dict
+        elif rejected is not None:
+            pmid_elem = elem.find(".//PMID")
+            if pmid_elem is not None and pmid_elem.text:
+                rejected.append(pmid_elem.text)
+        # Drop the finished record and anything the root still holds.
+        elem.clear()
+        root.clear()
+
+def iter_response_articles(body, rejected=None, expected=None):
+    """
+    iter_pubmed_articles over an E-utilities response body, recording the time spent
+    parsing (excluding time blocked on reading the body) in the parse histogram. A body
+    that parses to the end is marked valid, which lets the client cache it. With
+    `expected`, a body holding fewer records than that (e.g. an <ERROR> body) raises
+    IncompleteResponse instead.
+    """
+    rejected = [] if rejected is None else rejected
+    rejected_before = len(rejected)
+    articles = iter_pubmed_articles(body, rejected)
+    elapsed = 0.0
+    returned = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                article_dict = next(articles)
+            except StopIteration:
+                records = returned + len(rejected) - rejected_before
+                if expected is not None and records < expected:
+                    raise IncompleteResponse(f"efetch returned {records} of {expected} records")
+                body.mark_valid()
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            returned += 1
+            yield article_dict
+    finally:
+        metrics.PUBMED_PARSE_SECONDS.observe(max(0.0, elapsed - body.read_seconds))
+
+def stream_articles(webenv, query_key, retstart=0, retmax=10000, expected=None):
+    """
+    Fetch a batch from efetch as a streamed HTTP response and yield parsed article dicts.
+    Raises IncompleteResponse if the response holds fewer than `expected` records.
+    """
+    params = {
+        "db": "pubmed",
+        "query_key": query_key,
+        "WebEnv": webenv,
+        "retstart": retstart,
+        "retmax": retmax,
+        "rettype": "abstract",
+        "retmode": "xml"
+    }
+    with eutils_client.open("efetch.fcgi", params) as body:
+        yield from iter_response_articles(body, expected=expected)
+
+def stream_articles_by_id(pmids, rejected=None):
+    """
+    Fetch the given PMIDs from efetch as a streamed HTTP response and yield parsed article
+    dicts. The PMIDs returned that are not journal articles are appended to `rejected`.
+    """
+    data = {
+        "db": "pubmed",
+        "id": ",".join(pmids),
+        "rettype": "abstract",
+        "retmode": "xml"
+    }
+    with eutils_client.open("efetch.fcgi", data, method="POST") as body:
+        yield from iter_response_articles(body, rejected)
 
 def parse_pubmed_xml_to_json(xml_data):
-    articles_json = []
-    root = ET.fromstring(xml_data)
-    for article in root.findall(".//PubmedArticle"):
-        pmid_elem = article.find(".//PMID")
-        pmid = pmid_elem.text if pmid_elem is not None else ""
-        title_elem = article.find(".//ArticleTitle")
-        title = title_elem.text if title_elem is not None else ""
-        abstract_elems = article.findall(".//AbstractText")
-        abstract_text_parts = []
-        for elem in abstract_elems:
-            abstract_text_parts.append("".join(elem.itertext()))
-        abstract_text = " ".join(abstract_text_parts)
-        journal_elem = article.find(".//Journal/Title")
-        journal = journal_elem.text if journal_elem is not None else ""
-        year_elem = article.find(".//JournalIssue/PubDate/Year")
-        pub_year = year_elem.text if year_elem is not None else ""
-        author_elems = article.findall(".//AuthorList/Author")
-        authors = []
-        for auth in author_elems:
-            last_name = auth.find("LastName")
-            fore_name = auth.find("ForeName")
-            name = ""
-            if last_name is not None:
-                name += last_name.text
-            if fore_name is not None:
-                name += ", " + fore_name.text
-            if name:
-                authors.append(name)
-        pub_types = article.findall(".//PublicationTypeList/PublicationType")
-        pub_type_strings = [pt.text for pt in pub_types if pt.text]
-        if "Journal Article" not in pub_type_strings:
+    return list(iter_pubmed_articles(StringIO(xml_data)))
+
+def _fetch_batch(articles, journal, count, fetched, progress):
+    """Drain an article generator into a list, reporting progress against the journal total."""
+    batch_articles = []
+    for article_dict in articles:
+        batch_articles.append(article_dict)
+        if (fetched + len(batch_articles)) % PROGRESS_INTERVAL == 0:
+            progress(f"Parsed {fetched + len(batch_articles)} of {count} articles for {journal}\n")
+    return batch_articles
+
+# Worth retrying: transient transport errors, and efetch XML cut off mid-stream.
+RETRY_ERRORS = TRANSIENT_ERRORS + (ET.ParseError,)
+
+def with_retries(call, endpoint, description, progress, stop=None):
+    """call() with FETCH_RETRIES retries and backoff, reporting each retry to `progress`."""
+    def on_retry(error, delay):
+        metrics.PUBMED_RETRIES.inc(endpoint=endpoint)
+        progress(f"Retrying {description} in {delay:.1f}s after error: {error}\n")
+    return retry(call, RETRY_ERRORS, attempts=FETCH_RETRIES + 1, base_delay=FETCH_BACKOFF_SECONDS,
+                 stop=stop, on_retry=on_retry)
+
+def _split_ids(pmids):
+    half = len(pmids) // 2
+    return [pmids[:half], pmids[half:]] if len(pmids) > MIN_BATCH_SIZE else None
+
+def _split_range(batch):
+    retstart, retmax = batch
+    half = retmax // 2
+    return [(retstart, half), (retstart + half, retmax - half)] if retmax > MIN_BATCH_SIZE else None
+
+def fetch_in_parts(fetch, batch, split, describe, progress, stop=None):
+    """
+    Yield (part, articles) pairs covering `batch`. fetch(batch) is retried with backoff;
+    if it keeps failing, the batch is replaced by the halves split(batch) returns and
+    each is fetched the same way. A part that split() cannot divide further and that
+    still fails is reported and yielded with articles None.
+    """
+    try:
+        yield batch, with_retries(lambda: fetch(batch), "efetch", describe(batch), progress, stop)
+        return
+    except RETRY_ERRORS as e:
+        error = e
+    parts = None if stop is not None and stop.is_set() else split(batch)
+    if not parts:
+        progress(f"Error fetching {describe(batch)}: {error}\n")
+        yield batch, None
+        return
+    progress(f"Splitting {describe(batch)} into smaller batches after error: {error}\n")
+    for part in parts:
+        yield from fetch_in_parts(fetch, part, split, describe, progress, stop)
+
+def _missing_ranges(done, start, end):
+    """Yield (retstart, retmax) for the parts of records [start, end) not covered by `done`."""
+    position = start
+    for retstart in sorted(done):
+        retmax = done[retstart][0]
+        if retstart + retmax <= position:
             continue
-        article_dict = {
-            "pmid": pmid,
-            "title": title,
-            "abstract": abstract_text,
-            "journal": journal,
-            "publication_year": pub_year,
-            "authors": authors
-        }
-        articles_json.append(article_dict)
-    return articles_json
-
-def stream_pubmed_query(selected_journals, start_date, end_date):
-    global papers_data
-    papers_data = []  # Clear previous results
-    for journal in selected_journals:
-        yield f"\nProcessing journal: {journal}\n"
-        query = f'"{journal}"[Journal] AND ("{start_date}"[Date - Publication] : "{end_date}"[Date - Publication])'
+        if retstart >= end:
+            break
+        if retstart > position:
+            yield position, retstart - position
+        position = retstart + retmax
+    if position < end:
+        yield position, end - position
+
+def _ingest(ingest, papers):
+    """Score `papers` into the query's IngestScores, if it keeps one."""
+    if ingest is not None:
+        with metrics.INGEST_SCORE_SECONDS.time():
+            ingest.add(papers)
+
+@contextmanager
+def _ingest_alongside(ingest, papers):
+    """
+    Score `papers` into `ingest` on a background thread while the with block runs, so
+    scoring stored papers overlaps the block's network waits instead of preceding them.
+    """
+    if ingest is None:
+        yield
+        return
+    with ThreadPoolExecutor(max_workers=1) as scoring:
+        scored = scoring.submit(metrics.in_context(_ingest), ingest, papers)
+        yield
+        scored.result()
+
+def _report_failed(journal, failed, progress):
+    if failed:
+        metrics.PUBMED_FAILED_RECORDS.inc(failed)
+        progress(f"{failed} records for {journal} could not be fetched; run the query again to fetch them.\n")
+
+def list_history_ids(journal, webenv, query_key, count, progress, stop=None):
+    """All `count` PMIDs of a history-server result set, listed ESEARCH_MAX_IDS at a time."""
+    id_list = []
+    for retstart in range(0, count, ESEARCH_MAX_IDS):
+        retmax = min(ESEARCH_MAX_IDS, count - retstart)
+        id_list.extend(with_retries(lambda: fetch_history_ids(webenv, query_key, retstart, retmax), "efetch",
+                                    f"PMID list {retstart} to {retstart + retmax} for {journal}", progress, stop))
+    return id_list
+
+def sync_journal(journal, start_date, end_date, progress, stop=None, ingest=None):
+    """
+    Bring the paper store up to date for one journal and date range, and return the
+    PMIDs the query covers. A count-only esearch sizes the result set first. The
+    query's PMIDs are then listed, by esearch when it can list them all and from the
+    history server otherwise, and diffed against the store so only new PMIDs are
+    fetched. If the history server cannot list them, the records are paged through
+    instead.
+    Progress lines are passed to `progress` instead of being yielded so several
+    journals can run on worker threads. Setting `stop` abandons remaining batches.
+    Every article the query covers, stored or fetched, is scored into `ingest`.
+    """
+    progress(f"\nProcessing journal: {journal}\n")
+    query = f'"{journal}"[Journal] AND ("{start_date}"[Date - Publication] : "{end_date}"[Date - Publication])'
+    try:
+        webenv, query_key, count = with_retries(lambda: count_pubmed_ids(query), "esearch",
+                                                f"esearch for {journal}", progress, stop)
+        id_list = None
+        if count <= ESEARCH_MAX_IDS:
+            id_list = with_retries(lambda: fetch_pubmed_ids(query)[3], "esearch",
+                                   f"esearch for {journal}", progress, stop) if count else []
+    except Exception as e:
+        progress(f"Error fetching IDs for {journal}: {e}\n")
+        return []
+    progress(f"Found {count} articles for {journal}.\n")
+    if id_list is None:
         try:
-            webenv, query_key, count, id_list = fetch_pubmed_ids(query)
-        except Exception as e:
-            yield f"Error fetching IDs for {journal}: {e}\n"
-            continue
-        yield f"Found {count} articles for {journal}.\n"
-        journal_articles = []
+            id_list = list_history_ids(journal, webenv, query_key, count, progress, stop)
+        except RETRY_ERRORS as e:
+            progress(f"Could not list the PMIDs for {journal} ({e}); fetching every record instead.\n")
+    if id_list is not None:
+        return _sync_by_id(journal, id_list, progress, stop, ingest)
+    return _sync_by_history(journal, query, webenv, query_key, count, progress, stop, ingest)
+
+def _sync_by_id(journal, id_list, progress, stop=None, ingest=None):
+    """Fetch the PMIDs of `id_list` that are not stored yet. Returns id_list."""
+    known = paper_store.known_pmids(id_list)
+    new_ids = [pmid for pmid in id_list if pmid not in known]
+    progress(f"{len(known)} already stored, fetching {len(new_ids)} new articles for {journal}.\n")
+    fetched = 0
+    failed = 0
+
+    def fetch(batch_ids):
+        rejected = []
+        articles = _fetch_batch(stream_articles_by_id(batch_ids, rejected), journal, len(new_ids), fetched, progress)
+        return articles, rejected
+
+    def describe(batch_ids):
+        return f"{len(batch_ids)} records from PMID {batch_ids[0]} for {journal}"
+
+    with _ingest_alongside(ingest, paper_store.iter_papers(pmid for pmid in id_list if pmid in known)):
+        for start in range(0, len(new_ids), BATCH_SIZE):
+            if stop is not None and stop.is_set():
+                break
+            batch_ids = new_ids[start:start + BATCH_SIZE]
+            progress(f"Fetching records {start} to {start + len(batch_ids)} for {journal} ...\n")
+            for part_ids, result in fetch_in_parts(fetch, batch_ids, _split_ids, describe, progress, stop):
+                if result is None:
+                    # Nothing is recorded for these, so the next query diffs them in again.
+                    failed += len(part_ids)
+                    continue
+                batch_articles, rejected = result
+                paper_store.add_papers(batch_articles)
+                # Records efetch returned that are not journal articles are remembered so they are not
+                # refetched. PMIDs it did not return at all are left to be diffed in again next time.
+                paper_store.mark_skipped(rejected)
+                _ingest(ingest, batch_articles)
+                fetched += len(batch_articles)
+    progress(f"Completed processing {fetched} new articles from {journal}\n")
+    _report_failed(journal, failed, progress)
+    return id_list
+
+def _sync_by_history(journal, query, webenv, query_key, count, progress, stop=None, ingest=None):
+    """
+    Page through all `count` results of `query` on the history server and return their
+    PMIDs. Each range is checkpointed in the paper store once efetch has returned all
+    of its records, so after an interruption the next run of the same query fetches
+    only the ranges still missing. A short range, such as an <ERROR> body for an
+    expired WebEnv, is retried on fresh handles and never checkpointed. The checkpoint
+    is dropped once every range has been fetched.
+    """
+    done = paper_store.load_checkpoint(query, count)
+    if done:
+        progress(f"Resuming {journal}: {sum(retmax for retmax, _ in done.values())} of {count} "
+                 f"records already fetched.\n")
+    resumed = [pmid for retstart in sorted(done) for pmid in done[retstart][1]]
+    fetched = 0
+    failed = 0
+
+    def fetch(batch):
+        nonlocal webenv, query_key
+        retstart, retmax = batch
+        try:
+            # Every range lies within `count`, so a full response holds retmax records.
+            return _fetch_batch(stream_articles(webenv, query_key, retstart=retstart, retmax=retmax, expected=retmax),
+                                journal, count, fetched, progress)
+        except IncompleteResponse:
+            # A short or empty range usually means the WebEnv expired: retry on fresh handles.
+            webenv, query_key, _ = count_pubmed_ids(query)
+            raise
+
+    def describe(batch):
+        return f"records {batch[0]} to {batch[0] + batch[1]} for {journal}"
+
+    with _ingest_alongside(ingest, paper_store.iter_papers(resumed)):
         for start in range(0, count, BATCH_SIZE):
-            yield f"Fetching records ...\n"
+            if stop is not None and stop.is_set():
+                break
+            for missing in _missing_ranges(done, start, min(start + BATCH_SIZE, count)):
+                progress(f"Fetching {describe(missing)} ...\n")
+                for (retstart, retmax), batch_articles in fetch_in_parts(fetch, missing, _split_range,
+                                                                         describe, progress, stop):
+                    if batch_articles is None:
+                        failed += retmax
+                        continue
+                    paper_store.add_papers(batch_articles)
+                    pmids = [a["pmid"] for a in batch_articles]
+                    paper_store.save_checkpoint(query, count, retstart, retmax, pmids)
+                    done[retstart] = (retmax, pmids)
+                    _ingest(ingest, batch_articles)
+                    fetched += len(batch_articles)
+    progress(f"Completed processing {fetched} articles from {journal}\n")
+    _report_failed(journal, failed, progress)
+    if not failed and not (stop is not None and stop.is_set()):
+        paper_store.clear_checkpoint(query)
+    return [pmid for retstart in sorted(done) for pmid in done[retstart][1]]
+
+def format_top_papers(best) -> str:
+    lines = ["\nCurrent top papers:\n"]
+    lines.extend(f"  {score:.2f}  {title}\n" for score, title, _ in best)
+    return "".join(lines)
+
+def stream_pubmed_query(selected_journals, start_date, end_date, max_workers=FETCH_WORKERS):
+    """
+    Sync the selected journals on a thread pool and yield their progress lines as
+    they arrive. Request pacing is left to eutils_client's rate limiter, so the query
+    runs at NCBI's allowed rate instead of sleeping between batches. papers_data is
+    then loaded from the paper store, as a compact Corpus, with every article the
+    query covers, and saved as the corpus snapshot that every worker maps.
+
+    Workers score each batch with default_keywords as they store it, so the default
+    keyword ranking of papers_data is cached when the query finishes, and the best
+    papers so far are reported while it runs.
+    """
+    global papers_data
+    papers_data = Corpus()  # Clear previous results
+    messages = queue.Queue()
+    stop = threading.Event()
+    scorer = get_keyword_scorer(default_keywords)
+    ingest = IngestScores(lambda abstract: scorer.score(abstract) / 100.0, LIVE_TOP_N)
+    reported_version = 0
+    reported_at = time.monotonic()
+    workers = max(1, min(max_workers, len(selected_journals)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Workers record into this request's timings too, if it asked for them.
+        futures = [pool.submit(metrics.in_context(sync_journal), journal, start_date, end_date,
+                               messages.put, stop, ingest)
+                   for journal in selected_journals]
+        try:
+            while not all(future.done() for future in futures) or not messages.empty():
+                try:
+                    yield messages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+                if ingest.version != reported_version and time.monotonic() - reported_at >= LIVE_TOP_INTERVAL:
+                    reported_version = ingest.version
+                    reported_at = time.monotonic()
+                    yield format_top_papers(ingest.best())
+        finally:
+            # Client disconnected or query finished: stop workers at the next batch.
+            # This must happen before leaving the with block, whose shutdown waits for them.
+            stop.set()
+        # Keep journal order stable regardless of which finished first.
+        query_pmids = []
+        for journal, future in zip(selected_journals, futures):
             try:
-                xml_chunk = fetch_articles_as_xml(webenv, query_key, retstart=start, retmax=BATCH_SIZE)
-                chunk_json = parse_pubmed_xml_to_json(xml_chunk)
-                journal_articles.extend(chunk_json)
+                query_pmids.extend(future.result())
             except Exception as e:
-                yield f"Error fetching records {start} to {start+BATCH_SIZE} for {journal}: {e}\n"
-            time.sleep(DELAY_BETWEEN_REQUESTS)
-        papers_data.extend(journal_articles)
-        yield f"Completed processing {len(journal_articles)} articles from {journal}\n"
+                yield f"Error processing {journal}: {e}\n"
+        papers_data = Corpus.from_papers(paper_store.iter_papers(dict.fromkeys(query_pmids)))
+        if CORPUS_SNAPSHOT_PATH:
+            # Publish to the other workers, and serve this one from the shared mapping too.
+            papers_data.save(CORPUS_SNAPSHOT_PATH)
+            papers_data = Corpus.open(CORPUS_SNAPSHOT_PATH)
+        with metrics.RANK_SECONDS.time(method="keyword"):
+            cache_ranking("keyword", default_keywords, ingest.ranking(papers_data))
+    if ingest.version != reported_version:
+        yield format_top_papers(ingest.best())
     yield f"\nQuery finished. Total articles collected: {len(papers_data)}\n"
 
 # ---------------------------
 # PDF Summarization Endpoint
 # ---------------------------
 # Import functions from summarizer.py
-from summarizer import pdf_to_text_file, summarization_stream
+from summarizer import extract_pdf_text_stream, summarization_stream
+from jobs import JobManager, FAILED
+
+# Summarization runs as background jobs whose events are persisted, so a dropped
+# connection does not lose the work and clients can resume from an event offset.
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "jobs.db")
+SUMMARIZE_WORKERS = int(os.environ.get("SUMMARIZE_WORKERS", 2))
+# A job whose process has not renewed its lease for this long is marked interrupted.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+# Finished jobs and their events are deleted this long after they finish.
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+job_manager = JobManager(JOBS_DB_PATH, max_workers=SUMMARIZE_WORKERS, lease_seconds=JOB_LEASE_SECONDS,
+                         retention_seconds=JOB_RETENTION_SECONDS)
+
+def summarize_job(file_bytes, current_api_key, use_cache=True):
+    """Extract the PDF, then summarize it; yields the same messages /summarize streams."""
+    # Stream page-by-page extraction progress before summarizing.
+    pdf_text = yield from extract_pdf_text_stream(file_bytes)
+    yield "PDF converted to txt\n"
+    yield from summarization_stream(pdf_text, current_api_key, use_cache=use_cache)
+
+def with_timing_summary(events, as_json=True):
+    """
+    Yield the events, then one message summarizing the stage timings, LLM token
+    counts and cache lookups recorded while producing them.
+    """
+    timings = metrics.RequestTimings()
+    yield from metrics.track(events, timings)
+    if as_json:
+        yield json.dumps({"type": "log", "message": timings.summary(), "timings": timings.as_dict()}) + "\n"
+    else:
+        yield f"\n{timings.summary()}\n"
+
+def timed_job(task, *args):
+    """Job task running task(*args) followed by its timing summary."""
+    return with_timing_summary(task(*args))
+
+def stream_job_events(job_id, offset=0):
+    """Follow a job's events from `offset`, ending with an error message if the job failed."""
+    yield from job_manager.follow(job_id, offset)
+    status = job_manager.status(job_id)
+    if status is not None and status["status"] == FAILED:
+        yield json.dumps({"type": "log", "message": f"Job failed: {status['error']}"}) + "\n"
+
+def submit_summarize_job():
+    """Queue a summarization job for the uploaded PDF; returns (job_id, None) or (None, error response)."""
+    if 'pdf' not in request.files:
+        return None, ("No file uploaded", 400)
+    file_bytes = request.files['pdf'].read()
+    # Send use_cache=0 to force fresh LLM calls instead of replaying cached results.
+    use_cache = request.form.get('use_cache', '1') != '0'
+    # Get API key for summarization
+    current_api_key = get_api_key()
+    # Send timings=1 to end the stream with a per-stage timing and token summary.
+    if request.form.get('timings') == '1':
+        return job_manager.submit("summarize", timed_job, summarize_job, file_bytes, current_api_key, use_cache), None
+    return job_manager.submit("summarize", summarize_job, file_bytes, current_api_key, use_cache), None
+
+# Number of papers summarized at once in a batch. LLM calls across all papers are
+# further limited by summarizer's global concurrency and requests-per-minute limits.
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 8))
+
+def paper_to_text(paper):
+    """Text handed to the summarizer for a paper known only from PubMed (no PDF)."""
+    authors = "; ".join(paper.get('authors') or [])
+    return (f"Title: {paper.get('title') or ''}\n"
+            f"Journal: {paper.get('journal') or ''} ({paper.get('publication_year') or ''})\n"
+            f"Authors: {authors}\n\n"
+            f"Abstract:\n{paper.get('abstract') or ''}")
+
+def tag_event(event, paper_id):
+    """Add a paper_id to a summarization message; plain-text lines become log messages."""
+    try:
+        data = json.loads(event)
+    except ValueError:
+        data = {"type": "log", "message": event.strip()}
+    data["paper_id"] = paper_id
+    return data
+
+def batch_summarize_job(items, current_api_key, use_cache=True, timings=False, missing=()):
+    """
+    Summarize several papers concurrently. `items` is a list of (paper_id, kind, payload)
+    where kind is "text" (payload is paper text) or "pdf" (payload is PDF bytes).
+    Every message is tagged with its paper_id and streamed as it is produced; when a
+    paper finishes, a "result" message carries its final summary and score. With
+    timings, each paper's messages end with its own timing summary. Requested PMIDs
+    that are not in the store (`missing`) are listed in a "missing" message first.
+    """
+    messages = queue.Queue()
+
+    def run(paper_id, kind, payload):
+        last_blog = ""
+        final_score = ""
+        try:
+            if kind == "pdf":
+                events = summarize_job(payload, current_api_key, use_cache)
+            else:
+                events = summarization_stream(payload, current_api_key, use_cache=use_cache)
+            if timings:
+                events = with_timing_summary(events)
+            for event in events:
+                data = tag_event(event, paper_id)
+                if data["type"] == "blog":
+                    last_blog = data["message"]
+                elif data["type"] == "score":
+                    final_score = data["message"]
+                messages.put(json.dumps(data) + "\n")
+        except Exception as e:
+            messages.put(json.dumps({"type": "log", "paper_id": paper_id, "message": f"Error: {e}"}) + "\n")
+        messages.put(json.dumps({"type": "result", "paper_id": paper_id,
+                                 "message": last_blog, "score": final_score}) + "\n")
+
+    if missing:
+        yield json.dumps({"type": "missing", "pmids": list(missing),
+                          "message": f"Not in the local store, skipped: {', '.join(missing)}"}) + "\n"
+    yield json.dumps({"type": "log", "message": f"Summarizing {len(items)} papers..."}) + "\n"
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(items)))) as pool:
+        futures = [pool.submit(run, *item) for item in items]
+        while not all(future.done() for future in futures) or not messages.empty():
+            try:
+                yield messages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    yield json.dumps({"type": "log", "message": "Batch summarization completed."}) + "\n"
+
+def batch_items_from_request(data):
+    """
+    Build the batch from the request: uploaded PDFs (form field "pdfs"), a JSON list
+    of "pmids", or the "top_n" ranked papers (with optional scoring_method/keywords).
+    Returns (items, PMIDs not found in the store, None), or (None, None, error message)
+    if the request is malformed.
+    """
+    pdfs = request.files.getlist('pdfs')
+    if pdfs:
+        return [(pdf.filename or f"pdf-{i}", "pdf", pdf.read()) for i, pdf in enumerate(pdfs, 1)], [], None
+    missing = []
+    pmids = data.get('pmids')
+    if pmids:
+        if not isinstance(pmids, list) or not all(isinstance(pmid, (str, int)) and not isinstance(pmid, bool)
+                                                  for pmid in pmids):
+            return None, None, "pmids must be a list of PMIDs"
+        pmids = [str(pmid) for pmid in pmids]
+        papers = paper_store.get_papers(pmids)
+        found = {paper['pmid'] for paper in papers}
+        missing = [pmid for pmid in dict.fromkeys(pmids) if pmid not in found]
+    else:
+        try:
+            top_n = _positive_int(data.get('top_n', 5))
+        except (TypeError, ValueError):
+            return None, None, "top_n must be a positive integer"
+        keywords = data.get('keywords') or default_keywords
+        if not _is_string_list(keywords):
+            return None, None, "keywords must be a list of strings"
+        papers = [paper for _, paper in rank_paper_records(
+            load_papers_data(), keywords, scoring_method=data.get('scoring_method', "keyword"), top_n=top_n)]
+    return [(paper['pmid'], "text", paper_to_text(paper)) for paper in papers], missing, None
 
 def get_api_key():
     """Prompt user for API key if not already set"""
@@ -312,36 +1090,171 @@ def run_query():
     selected_journals = data.get('journals', [])
     start_date = data.get('start_date', "2024/01/1")
     end_date = data.get('end_date', "3000")
-    return Response(stream_pubmed_query(selected_journals, start_date, end_date),
-                    mimetype='text/plain')
+    events = stream_pubmed_query(selected_journals, start_date, end_date)
+    # "timings": true ends the log with where the query's time went.
+    if data.get('timings'):
+        events = with_timing_summary(events, as_json=False)
+    return Response(events, mimetype='text/plain')
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def _positive_int(value):
+    """int(value) if that is at least 1; raises ValueError otherwise."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    number = int(value)
+    if number < 1:
+        raise ValueError(value)
+    return number
 
 @app.route('/rank', methods=['POST'])
 def rank_query():
-    data = request.get_json()
-    top_n = int(data.get('top_n', 5))
-    ranking_result = rank_papers(top_n)
+    data = request.get_json(silent=True) or {}
+    try:
+        top_n = _positive_int(data.get('top_n', 5))
+    except (TypeError, ValueError):
+        return jsonify({"output": "top_n must be a positive integer"}), 400
+    scoring_method = data.get('scoring_method', "keyword")
+    if scoring_method not in ("keyword", "bm25"):
+        return jsonify({"output": f"Unknown scoring method: {scoring_method}"}), 400
+    # Optional custom keyword list; defaults to default_keywords.
+    keywords = data.get('keywords') or None
+    if keywords is not None and not _is_string_list(keywords):
+        return jsonify({"output": "keywords must be a list of strings"}), 400
+    ranking_result = rank_papers(top_n, scoring_method=scoring_method, keywords=keywords)
     return jsonify({"output": ranking_result})
 
+def _optional_int(value):
+    return None if value is None or value == "" else int(value)
+
+@app.route('/rank/records', methods=['POST'])
+def rank_records():
+    """
+    Ranked papers as JSON records, one page at a time. Optional filters: "journals"
+    (list of names), "year_from" and "year_to". "limit" sets the page size, and the
+    "next_cursor" of a response fetches the next page. Scores are computed once per
+    corpus, scoring method and keyword list; pages and filters reuse them.
+    """
+    data = request.get_json(silent=True) or {}
+    scoring_method = data.get('scoring_method', "keyword")
+    if scoring_method not in ("keyword", "bm25"):
+        return jsonify({"error": f"Unknown scoring method: {scoring_method}"}), 400
+    keywords = data.get('keywords') or default_keywords
+    if not _is_string_list(keywords):
+        return jsonify({"error": "keywords must be a list of strings"}), 400
+    journals = data.get('journals') or []
+    if isinstance(journals, str):
+        journals = [journals]
+    if not _is_string_list(journals):
+        return jsonify({"error": "journals must be a list of strings"}), 400
+    try:
+        year_from = _optional_int(data.get('year_from'))
+        year_to = _optional_int(data.get('year_to'))
+        limit = max(1, min(int(data.get('limit', 20)), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "year_from, year_to and limit must be integers"}), 400
+    papers = load_papers_data()
+    ranking = get_ranking(papers, scoring_method, keywords)
+    query = {"scoring_method": scoring_method, "keywords": list(keywords),
+             "journals": sorted(journal.lower() for journal in journals), "year_from": year_from, "year_to": year_to}
+    offset = 0
+    if data.get('cursor'):
+        try:
+            offset = decode_cursor(data['cursor'], ranking, query)
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+    page, total = ranking.page(offset, limit, journals=journals, year_from=year_from, year_to=year_to)
+    results = [{
+        "rank": offset + i + 1,
+        "pmid": papers.get(position, 'pmid'),
+        "score": score,
+        "title": papers.get(position, 'title'),
+        "journal": papers.get(position, 'journal'),
+        "year": papers.get(position, 'publication_year'),
+        "authors": papers.get(position, 'authors'),
+    } for i, (position, score) in enumerate(page)]
+    next_offset = offset + len(page)
+    return jsonify({
+        "total": total,
+        "results": results,
+        "next_cursor": encode_cursor(ranking, query, next_offset) if next_offset < total else None,
+    })
+
 @app.route('/summarize', methods=['POST'])
 def summarize():
     """
     Endpoint to handle PDF upload, convert the PDF to text, then run the summarization process.
-    The process prints messages in real time.
+    The process prints messages in real time, starting with PDF extraction progress.
+    The work runs as a background job; the X-Job-Id header lets a client that loses the
+    connection resume from /jobs/<job_id>/events.
     """
-    if 'pdf' not in request.files:
-        return "No file uploaded", 400
-    pdf_file = request.files['pdf']
-    file_bytes = pdf_file.read()
-    pdf_text = pdf_to_text_file(file_bytes)
-    
-    # Get API key for summarization
-    current_api_key = get_api_key()
-    
-    def generate():
-        yield "PDF converted to txt\n"
-        for output in summarization_stream(pdf_text, current_api_key):
-            yield output
-    return Response(generate(), mimetype='text/plain')
+    job_id, error = submit_summarize_job()
+    if error:
+        return error
+    return Response(stream_job_events(job_id), mimetype='text/plain', headers={"X-Job-Id": job_id})
+
+@app.route('/jobs/summarize', methods=['POST'])
+def submit_summarize():
+    """Queue a summarization job and return its ID immediately."""
+    job_id, error = submit_summarize_job()
+    if error:
+        return error
+    return jsonify({"job_id": job_id}), 202
+
+@app.route('/batch/summarize', methods=['POST'])
+def batch_summarize():
+    """
+    Summarize a batch of papers concurrently, streaming messages tagged by paper_id
+    as they are produced. Runs as a background job (see X-Job-Id).
+    """
+    data = request.get_json(silent=True) or {}
+    scoring_method = data.get('scoring_method', "keyword")
+    if scoring_method not in ("keyword", "bm25"):
+        return jsonify({"error": f"Unknown scoring method: {scoring_method}"}), 400
+    items, missing, error = batch_items_from_request(data)
+    if error:
+        return jsonify({"error": error}), 400
+    if not items:
+        return jsonify({"error": "No papers to summarize. Run the PubMed query or upload PDFs.",
+                        "missing_pmids": missing}), 400
+    # Send use_cache=0 (form field or JSON) to force fresh LLM calls.
+    use_cache = str(request.form.get('use_cache', data.get('use_cache', '1'))) != '0'
+    timings = str(request.form.get('timings', data.get('timings', '0'))).lower() in ('1', 'true')
+    job_id = job_manager.submit("batch", batch_summarize_job, items, get_api_key(), use_cache, timings, missing)
+    return Response(stream_job_events(job_id), mimetype='text/plain', headers={"X-Job-Id": job_id})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Return a job's events from ?offset=N. With ?follow=1 the events are streamed as
+    they are produced until the job finishes; otherwise a JSON page is returned.
+    """
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    try:
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({"error": "offset must be an integer"}), 400
+    if offset < 0:
+        return jsonify({"error": "offset must not be negative"}), 400
+    if request.args.get('follow') == '1':
+        return Response(stream_job_events(job_id, offset), mimetype='text/plain')
+    events = job_manager.events(job_id, offset)
+    return jsonify({"status": status["status"], "events": events, "next_offset": offset + len(events)})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage timings, LLM token counts and cache hit/miss counters in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     # Prompt for API key when application starts
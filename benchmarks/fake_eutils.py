@@ -0,0 +1,141 @@
+# benchmarks/fake_eutils.py
+"""A local stand-in for NCBI esearch/efetch, serving synthetic PubMed records."""
+import random
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import iter_efetch_xml
+
+# Like NCBI, esearch lists at most this many IDs however large retmax is.
+ESEARCH_MAX_IDS = 10000
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.0: responses are streamed without a Content-Length and end when the connection closes.
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        self._handle(url.path, dict(urllib.parse.parse_qsl(url.query)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        self._handle(urllib.parse.urlparse(self.path).path, dict(urllib.parse.parse_qsl(body)))
+
+    def _handle(self, path, params):
+        server = self.server.eutils
+        server.record(path, params)
+        fault = server.fault(path, params)
+        if fault is not None:
+            self.send_error(fault)
+        elif path.endswith("/esearch.fcgi"):
+            self._send_text(server.esearch(params))
+        elif path.endswith("/efetch.fcgi") and params.get("rettype") == "uilist":
+            self._send_text(server.uilist(params))
+        elif path.endswith("/efetch.fcgi"):
+            self._send_stream(server.efetch(params), server.truncate())
+        else:
+            self.send_error(404)
+
+    def _send_text(self, text):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, pieces, truncate=False):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        for n, piece in enumerate(pieces):
+            self.wfile.write(piece.encode("utf-8"))
+            if truncate and n == 1:
+                # Drop the connection mid-document, as a dropped download would.
+                return
+
+
+class FakeEutilsServer:
+    """
+    Serves `count` synthetic articles (PMIDs 1..count) for any esearch term, efetch
+    by history (WebEnv/retstart/retmax), as records or as a PMID list (rettype=uilist),
+    and efetch by POSTed id list. Use as a
+    context manager and point the app's E-utilities client at `base_url`.
+
+    Faults can be injected to exercise retries: each request fails with a 503 with
+    probability `error_rate`, efetch responses are cut off mid-document with
+    probability `truncate_rate`, and efetch requests for more than `max_batch`
+    records always fail with a 500. `seed` makes the faults repeatable.
+    """
+
+    def __init__(self, count, host="127.0.0.1", port=0, error_rate=0.0, truncate_rate=0.0,
+                 max_batch=None, seed=0):
+        self.count = count
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.max_batch = max_batch
+        self.random = random.Random(seed)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.eutils = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def record(self, path, params):
+        with self.lock:
+            self.requests.append((path.rsplit("/", 1)[-1], params))
+
+    def fault(self, path, params):
+        """HTTP status to fail this request with, or None to serve it."""
+        if self.max_batch is not None and path.endswith("/efetch.fcgi") and params.get("rettype") != "uilist":
+            records = len(params["id"].split(",")) if "id" in params else int(params.get("retmax", 20))
+            if records > self.max_batch:
+                return 500
+        with self.lock:
+            return 503 if self.random.random() < self.error_rate else None
+
+    def truncate(self):
+        with self.lock:
+            return self.random.random() < self.truncate_rate
+
+    def esearch(self, params):
+        retmax = min(int(params.get("retmax", 20)), self.count, ESEARCH_MAX_IDS)
+        ids = "".join(f"<Id>{pmid}</Id>" for pmid in range(1, retmax + 1))
+        return (f"<?xml version=\"1.0\" ?><eSearchResult><Count>{self.count}</Count><RetMax>{retmax}</RetMax>"
+                f"<RetStart>0</RetStart><QueryKey>1</QueryKey><WebEnv>FAKE_WEBENV</WebEnv>"
+                f"<IdList>{ids}</IdList></eSearchResult>")
+
+    def _history_range(self, params):
+        start = int(params.get("retstart", 0))
+        return range(start + 1, min(start + int(params.get("retmax", 20)), self.count) + 1)
+
+    def uilist(self, params):
+        ids = "".join(f"<Id>{pmid}</Id>" for pmid in self._history_range(params))
+        return f"<?xml version=\"1.0\" ?><IdList>{ids}</IdList>"
+
+    def efetch(self, params):
+        if "id" in params:
+            pmids = [pmid for pmid in params["id"].split(",") if pmid]
+        else:
+            pmids = self._history_range(params)
+        return iter_efetch_xml(pmids)
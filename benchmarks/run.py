@@ -0,0 +1,428 @@
+# benchmarks/run.py
+"""
+Benchmark the hot paths and write machine-readable results.
+
+    python -m benchmarks.run --sizes 1000 100000 --output benchmark_results.json
+    python -m benchmarks.run --baseline old_results.json   # print speedups against an earlier run
+
+Every benchmark runs against synthetic data, a local stand-in E-utilities server
+and a stub Anthropic client, so no network access or API key is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep the app's on-disk stores and caches out of the working tree, and off so
+# repeated benchmark runs measure real work. Must happen before importing app.
+# The directory is removed when the process exits, however the run ends.
+_work_dir = tempfile.TemporaryDirectory(prefix="bench_")
+WORK_DIR = _work_dir.name
+os.environ["PAPER_STORE_PATH"] = os.path.join(WORK_DIR, "papers.db")
+os.environ["JOBS_DB_PATH"] = os.path.join(WORK_DIR, "jobs.db")
+os.environ["CORPUS_SNAPSHOT_PATH"] = os.path.join(WORK_DIR, "corpus.snapshot")
+os.environ["EUTILS_CACHE_DIR"] = ""
+os.environ["LLM_CACHE_PATH"] = ""
+# The stub LLM has no rate limit; only its configured latency should count.
+os.environ["LLM_REQUESTS_PER_MINUTE"] = "1000000"
+
+import app  # noqa: E402
+import summarizer  # noqa: E402
+from corpus import BYTES_PER_ARTICLE_OVERHEAD_TARGET, Corpus  # noqa: E402
+from paper_store import PaperStore  # noqa: E402
+from benchmarks import stub_llm  # noqa: E402
+from benchmarks.fake_eutils import FakeEutilsServer  # noqa: E402
+from benchmarks.synthetic import make_pdf, synthetic_papers, write_efetch_xml  # noqa: E402
+
+# The string-based parser holds the whole document and DOM; skip it above this size.
+MAX_STRING_PARSE_SIZE = 200000
+
+
+def measure(fn, measure_memory=True):
+    """Run fn once for time and, separately, once under tracemalloc for peak memory."""
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if measure_memory:
+        tracemalloc.start()
+        fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def record(results, name, size, unit, fn, measure_memory=True, **extra):
+    _, seconds, peak_mb = measure(fn, measure_memory)
+    row = {
+        "benchmark": name,
+        "size": size,
+        "unit": unit,
+        "seconds": round(seconds, 6),
+        "throughput": round(size / seconds, 2) if seconds else None,
+        "peak_memory_mb": round(peak_mb, 2) if peak_mb is not None else None,
+    }
+    row.update(extra)
+    results.append(row)
+    memory = f"{row['peak_memory_mb']:>10.1f} MB" if peak_mb is not None else ""
+    print(f"{name:<22} {size:>9} {unit:<9} {seconds:>10.3f} s {row['throughput'] or 0:>14.1f}/s {memory}", flush=True)
+    return row
+
+
+def bench_parse(results, size, measure_memory):
+    path = os.path.join(WORK_DIR, f"efetch_{size}.xml")
+    write_efetch_xml(path, size)
+
+    def parse_stream():
+        with open(path, "rb") as source:
+            return sum(1 for _ in app.iter_pubmed_articles(source))
+    record(results, "parse_stream", size, "articles", parse_stream, measure_memory)
+
+    if size <= MAX_STRING_PARSE_SIZE:
+        with open(path, encoding="utf-8") as source:
+            xml_data = source.read()
+        record(results, "parse_string", size, "articles",
+               lambda: app.parse_pubmed_xml_to_json(xml_data), measure_memory)
+    os.remove(path)
+
+
+def bench_pubmed_query(results, size, measure_memory):
+    with FakeEutilsServer(size) as server:
+        app.eutils_client.base_url = server.base_url
+
+        def query():
+            # A fresh store each time, so every run fetches every article.
+            fd, path = tempfile.mkstemp(dir=WORK_DIR, suffix=".db")
+            os.close(fd)
+            app.paper_store = PaperStore(path)
+            server.requests.clear()
+            for _ in app.stream_pubmed_query(["Nature"], "2024/01/1", "3000"):
+                pass
+        row = record(results, "pubmed_query", size, "articles", query, measure_memory)
+        row["requests"] = len(server.requests)
+        expected = app.paper_store.count()
+        # The query scored every article as it was stored, so this only reads the cached ranking.
+        record(results, "rank_after_query", size, "abstracts", lambda: app.rank_papers(10), measure_memory)
+
+    # The same query against a server that fails some requests, cuts off some responses
+    # and rejects full-size batches, so every batch is retried or split at least once.
+    with FakeEutilsServer(size, error_rate=0.05, truncate_rate=0.05, max_batch=app.BATCH_SIZE // 2) as server:
+        app.eutils_client.base_url = server.base_url
+        backoff = app.FETCH_BACKOFF_SECONDS
+        app.FETCH_BACKOFF_SECONDS = 0.01
+        try:
+            row = record(results, "pubmed_query_faults", size, "articles", query, False)
+            row["requests"] = len(server.requests)
+            row["complete"] = app.paper_store.count() == expected
+            assert row["complete"], f"the faulty query stored {app.paper_store.count()} of {expected} articles"
+        finally:
+            app.FETCH_BACKOFF_SECONDS = backoff
+
+
+def str_count_score(abstract, keywords):
+    """The original one-str.count-per-keyword scorer, kept as the reference KeywordScorer must match."""
+    abstract_lower = abstract.lower()
+    score = 0
+    for keyword in keywords:
+        keyword_lower = keyword.lower()
+        score += abstract_lower.count(keyword_lower) * app.keyword_weights.get(keyword_lower, 1)
+    for (keyword1, keyword2), multiplier in app.combinations.items():
+        if keyword1 in abstract_lower and keyword2 in abstract_lower:
+            score += min(abstract_lower.count(keyword1), abstract_lower.count(keyword2)) * multiplier
+    return score
+
+
+def check_keyword_parity(abstracts, trials=2000, seed=0):
+    """
+    Assert that KeywordScorer scores exactly like str_count_score, on the given abstracts
+    and on random text built from overlapping, repeated, mixed-case and empty keywords.
+    """
+    rng = random.Random(seed)
+    keyword_lists = [
+        app.default_keywords,
+        app.default_keywords + ["RNA", "Rna", "RNA-Seq", "prognos", "is", "a", "aa", "aaa", "ana", "ANA", ""],
+    ]
+    pieces = ["RNA", "rna", "RnA-sEq", "RNAseq", "prognosis", "Prognostic", "aaaa", "anana", "AnAnA",
+              "seq", "-", " ", "is", "iss", "sis"]
+    texts = list(abstracts[:200])
+    texts += ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 40))) for _ in range(trials)]
+    for keywords in keyword_lists:
+        scorer = app.KeywordScorer(keywords)
+        for text in texts:
+            expected = str_count_score(text, keywords)
+            assert scorer.score(text) == expected, (keywords, text, scorer.score(text), expected)
+
+
+def bench_scoring(results, size, measure_memory):
+    papers = list(synthetic_papers(size))
+    abstracts = [paper["abstract"] for paper in papers]
+    check_keyword_parity(abstracts)
+    keywords = app.default_keywords
+    record(results, "score_keyword", size, "abstracts",
+           lambda: [app.calculate_relevance_score(abstract, keywords) for abstract in abstracts], measure_memory)
+
+    app.papers_data = Corpus.from_papers(papers)
+    record(results, "rank_keyword", size, "abstracts", lambda: app.rank_papers(10), measure_memory)
+
+    def rank_bm25_cold():
+        app._bm25_cache = None
+        return app.rank_papers(10, scoring_method="bm25")
+    record(results, "rank_bm25_build", size, "abstracts", rank_bm25_cold, measure_memory)
+    record(results, "rank_bm25_query", size, "abstracts",
+           lambda: app.rank_papers(10, scoring_method="bm25"), measure_memory)
+
+    def ranking_cold():
+        app._rankings.clear()
+        return app.get_ranking(app.papers_data, "keyword", keywords)
+    record(results, "ranking_build", size, "abstracts", ranking_cold, measure_memory)
+    ranking = app.get_ranking(app.papers_data, "keyword", keywords)
+    filters = {"journals": ["Nature"], "year_from": 2018}
+    ranking.page(0, 20, **filters)
+    record(results, "ranking_page", 100, "pages",
+           lambda: [ranking.page(i * 20, 20, **filters) for i in range(100)], measure_memory)
+
+
+def retained_bytes(build):
+    """Memory still allocated after build() returns, while its result is alive."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def bench_corpus(results, size):
+    """Memory per article of the parsed articles held as a list of dicts versus a Corpus."""
+    path = os.path.join(WORK_DIR, f"efetch_{size}.xml")
+    write_efetch_xml(path, size)
+
+    def parsed():
+        with open(path, "rb") as source:
+            yield from app.iter_pubmed_articles(source)
+    text_bytes = sum(len(paper[field].encode("utf-8")) for paper in parsed()
+                     for field in ("pmid", "title", "abstract"))
+    for name, build in (("corpus_list_of_dicts", lambda: list(parsed())),
+                        ("corpus_columnar", lambda: Corpus.from_papers(parsed()))):
+        start = time.perf_counter()
+        retained = retained_bytes(build)
+        seconds = time.perf_counter() - start
+        overhead = (retained - text_bytes) / size
+        row = {
+            "benchmark": name,
+            "size": size,
+            "unit": "articles",
+            "seconds": round(seconds, 6),
+            "bytes_per_article": round(retained / size, 1),
+            "overhead_bytes_per_article": round(overhead, 1),
+        }
+        if name == "corpus_columnar":
+            row["overhead_target"] = BYTES_PER_ARTICLE_OVERHEAD_TARGET
+            row["meets_target"] = overhead <= BYTES_PER_ARTICLE_OVERHEAD_TARGET
+        results.append(row)
+        print(f"{name:<22} {size:>9} articles  {row['bytes_per_article']:>10.1f} B/article "
+              f"({row['overhead_bytes_per_article']:.1f} B over text)"
+              + (f", target {BYTES_PER_ARTICLE_OVERHEAD_TARGET}: {'met' if row['meets_target'] else 'MISSED'}"
+                 if "meets_target" in row else ""), flush=True)
+
+    # Snapshot round trip. Opening maps the file, so the heap it retains should not grow with size.
+    corpus = Corpus.from_papers(parsed())
+    snapshot_path = os.path.join(WORK_DIR, f"corpus_{size}.snapshot")
+    record(results, "corpus_snapshot_save", size, "articles", lambda: corpus.save(snapshot_path), False)
+    record(results, "corpus_snapshot_open", size, "articles", lambda: Corpus.open(snapshot_path), False,
+           retained_heap_bytes=retained_bytes(lambda: Corpus.open(snapshot_path)))
+    os.remove(snapshot_path)
+    os.remove(path)
+
+
+def bench_pdf(results, pages, measure_memory):
+    pdf_bytes = make_pdf(pages)
+    record(results, "pdf_extract", pages, "pages", lambda: summarizer.pdf_to_text_file(pdf_bytes), measure_memory)
+
+
+def check_paper_cache_layout():
+    """
+    Assert that ask_claude and stream_claude with cache_question=True send the paper as a
+    first block marked with cache_control, followed by the prompt as the only other block.
+    """
+    stub = stub_llm.install(summarizer)
+    prompt, paper = "Write a blog post about this paper.", "Background. Methods. Results."
+    summarizer.ask_claude(prompt, paper, "stub-key", use_cache=False, cache_question=True)
+    stream = summarizer.stream_claude(prompt, paper, "stub-key", use_cache=False, cache_question=True)
+    for _ in stream:
+        pass
+    assert len(stub.calls) == 2, stub.calls
+    for call in stub.calls:
+        content = call["messages"][0]["content"]
+        assert isinstance(content, list) and len(content) == 2, content
+        assert content[0].get("cache_control") == summarizer.PAPER_CACHE_CONTROL, content[0]
+        assert paper in content[0]["text"], content[0]
+        assert content[1] == {"type": "text", "text": prompt}, content[1]
+
+
+def check_chunk_order(trials=500, seed=0):
+    """
+    Assert that chunk_text keeps every character of the paper, in order, in chunks of at
+    most max_chars, including around paragraphs longer than a chunk.
+    """
+    rng = random.Random(seed)
+    cases = [("AAAA\n\n" + "B" * 25 + "\n\nCC", 10)]
+    for _ in range(trials):
+        paragraphs = ["".join(rng.choice("abc") for _ in range(rng.randint(0, 30))) for _ in range(rng.randint(1, 8))]
+        cases.append(("\n\n".join(paragraphs), rng.randint(1, 20)))
+    for text, max_chars in cases:
+        chunks = summarizer.chunk_text(text, max_chars)
+        assert all(len(chunk) <= max_chars for chunk in chunks), (text, max_chars, chunks)
+        # Chunk boundaries drop a paragraph separator, so compare without them.
+        assert "".join(chunks).replace("\n\n", "") == text.replace("\n\n", ""), (text, max_chars, chunks)
+
+
+def bench_summarize(results, latency, measure_memory):
+    check_paper_cache_layout()
+    check_chunk_order()
+    stub = stub_llm.install(summarizer, latency=latency)
+    paper_text = "\n\n".join(paper["abstract"] for paper in synthetic_papers(40))
+
+    # Seconds from the start of the first run to its first blog_delta and first finished blog.
+    first_output = {}
+
+    def run():
+        start = time.perf_counter()
+        for event in summarizer.summarization_stream(paper_text, "stub-key", use_cache=False):
+            event_type = json.loads(event)["type"]
+            if event_type in ("blog_delta", "blog") and event_type not in first_output:
+                first_output[event_type] = round(time.perf_counter() - start, 6)
+    calls_before = len(stub.calls)
+    row = record(results, "summarize_e2e", 1, "runs", run, measure_memory, llm_latency=latency)
+    row["first_delta_seconds"] = first_output.get("blog_delta")
+    row["first_blog_seconds"] = first_output.get("blog")
+    calls = stub.calls[calls_before:]
+    row["llm_calls"] = len(calls) // (2 if measure_memory else 1)
+    row["cache_read_tokens"] = stub.cache_read_tokens
+    row["cache_write_tokens"] = stub.cache_write_tokens
+    # Every writer call must send the paper as the same cached leading block.
+    writer_prefixes = {json.dumps(call["messages"][0]["content"][0], sort_keys=True)
+                       for call in calls if isinstance(call["messages"][0]["content"], list)}
+    assert len(writer_prefixes) == 1, "writer calls do not share one cached paper prefix"
+    assert stub.cache_read_tokens > 0, "no writer call read the paper from the prompt cache"
+
+
+# Papers summarized per prompt search benchmark, and the candidate counts compared.
+PROMPT_SEARCH_RUNS = 8
+PROMPT_SEARCH_WIDTHS = (1, 3)
+
+
+def bench_prompt_search(results, latency):
+    """
+    Time to reach TARGET_SCORE refining one prompt per round versus a beam search, with
+    a stub whose reviewers score each improved prompt a random step from its parent.
+    MAX_ITERATIONS is raised so that both searches are timed to the target, not to the cap.
+    """
+    stub = stub_llm.install(summarizer, latency=latency, prompt_gain=(-0.5, 1.0))
+    papers = list(synthetic_papers(PROMPT_SEARCH_RUNS * 20))
+    texts = ["\n\n".join(paper["abstract"] for paper in papers[i:i + 20]) for i in range(0, len(papers), 20)]
+    max_iterations, initial_prompt = summarizer.MAX_ITERATIONS, summarizer.INITIAL_PROMPT
+    summarizer.MAX_ITERATIONS = 30
+    try:
+        for width in PROMPT_SEARCH_WIDTHS:
+            outcomes = []
+
+            def run():
+                for n, text in enumerate(texts):
+                    # The stub's steps are seeded by the request, so each run starts from its own prompt.
+                    summarizer.INITIAL_PROMPT = f"{initial_prompt} (Run {n}.)"
+                    scores = [json.loads(event)["message"] for event in
+                              summarizer.summarization_stream(text, "stub-key", use_cache=False, beam_width=width)
+                              if json.loads(event)["type"] == "score"]
+                    rounds = {int(message.split()[1].split(".")[0].rstrip(":")) for message in scores[:-1]}
+                    outcomes.append((max(rounds), float(scores[-1].rsplit(" ", 1)[1])))
+            calls_before = len(stub.calls)
+            row = record(results, f"prompt_search_width_{width}", len(texts), "runs", run, False,
+                         llm_latency=latency)
+            row["llm_calls_per_run"] = round((len(stub.calls) - calls_before) / len(texts), 1)
+            row["mean_rounds"] = round(sum(rounds for rounds, _ in outcomes) / len(outcomes), 2)
+            row["reached_target"] = sum(score >= summarizer.TARGET_SCORE for _, score in outcomes)
+            print(f"{'':<22} {row['mean_rounds']} rounds and {row['llm_calls_per_run']} LLM calls per run, "
+                  f"{row['reached_target']} of {len(texts)} runs reached {summarizer.TARGET_SCORE}", flush=True)
+    finally:
+        summarizer.MAX_ITERATIONS, summarizer.INITIAL_PROMPT = max_iterations, initial_prompt
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as source:
+        baseline = {(row["benchmark"], row["size"]): row for row in json.load(source)["results"]}
+    print("\nSpeedup vs baseline (baseline seconds / current seconds):")
+    for row in results:
+        old = baseline.get((row["benchmark"], row["size"]))
+        if old and row["seconds"]:
+            print(f"{row['benchmark']:<22} {row['size']:>9} {old['seconds'] / row['seconds']:>8.2f}x")
+
+
+BENCHMARKS = ["parse", "pubmed_query", "scoring", "corpus", "pdf", "summarize", "prompt_search"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000],
+                        help="corpus sizes in articles (e.g. 1000 100000 1000000)")
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM seconds per call")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory runs")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+    # Unwind on SIGTERM too (e.g. a CI timeout), so WORK_DIR is still removed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    measure_memory = not args.no_memory
+
+    results = []
+    for size in args.sizes:
+        if "parse" in args.only:
+            bench_parse(results, size, measure_memory)
+        if "pubmed_query" in args.only:
+            bench_pubmed_query(results, size, measure_memory)
+        if "scoring" in args.only:
+            bench_scoring(results, size, measure_memory)
+        if "corpus" in args.only:
+            bench_corpus(results, size)
+    if "pdf" in args.only:
+        for pages in args.pdf_pages:
+            bench_pdf(results, pages, measure_memory)
+    if "summarize" in args.only:
+        bench_summarize(results, args.llm_latency, measure_memory)
+    if "prompt_search" in args.only:
+        bench_prompt_search(results, args.llm_latency)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
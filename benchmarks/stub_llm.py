@@ -0,0 +1,209 @@
+# benchmarks/stub_llm.py
+"""Deterministic stand-in for the Anthropic client, with configurable latency and prompt caching."""
+import hashlib
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+REVIEW_RESPONSE = (
+    "(a) Engaging: {score}/10\n(b) Relevance: {score}/10\n(c) Collaboration: {score}/10\n"
+    "(d) Credibility: {score}/10\nOverall score: {score}/10"
+)
+BLOG_RESPONSE = (
+    "Here is a blog post about the paper:\n\nTitle: What RNA Markers Tell Us About Prognosis\n\n"
+    + "A new study links RNA expression signatures to patient survival. " * 40
+)
+PROMPT_RESPONSE = "Write an engaging 500-800 word blog post that highlights the clinical relevance of the RNA markers."
+NOTES_RESPONSE = "Key findings: the RNA signature predicted overall survival (HR 0.6)."
+
+# With prompt_gain set, prompts and posts carry a hidden quality that reviewers score.
+QUALITY_MARKER = re.compile(r"\[quality (\d+(?:\.\d+)?)\]")
+
+# Anthropic allows at most this many cache_control breakpoints per request.
+MAX_CACHE_BREAKPOINTS = 4
+
+
+class BadRequest(Exception):
+    """Raised for request shapes the real API would reject with a 400."""
+
+
+def _blocks(kwargs):
+    """Every content block of the request in prompt order (system first), as dicts."""
+    system = kwargs.get("system")
+    if isinstance(system, str):
+        yield {"type": "text", "text": system}
+    elif system:
+        yield from system
+    for message in kwargs.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            yield {"type": "text", "text": content}
+        else:
+            yield from content
+
+
+def check_request(kwargs):
+    """Validate the request structure the way the API does, for the parts the app uses."""
+    messages = kwargs.get("messages")
+    if not messages or messages[0].get("role") != "user":
+        raise BadRequest("messages must start with a user message")
+    breakpoints = 0
+    for block in _blocks(kwargs):
+        if block.get("type") != "text" or not isinstance(block.get("text"), str) or not block["text"]:
+            raise BadRequest(f"invalid content block: {block!r}")
+        cache_control = block.get("cache_control")
+        if cache_control is not None:
+            if cache_control.get("type") != "ephemeral":
+                raise BadRequest(f"invalid cache_control: {cache_control!r}")
+            breakpoints += 1
+    if breakpoints > MAX_CACHE_BREAKPOINTS:
+        raise BadRequest(f"at most {MAX_CACHE_BREAKPOINTS} cache_control breakpoints are allowed")
+
+
+def _cached_prefix(kwargs):
+    """Text of the request up to and including its last cache_control block ("" if none)."""
+    prefix = []
+    cached = ""
+    for block in _blocks(kwargs):
+        prefix.append(block["text"])
+        if block.get("cache_control") is not None:
+            cached = "\n".join(prefix)
+    return cached
+
+
+def _message_text(kwargs):
+    """Flatten the request's system prompt and message contents into one string."""
+    return "\n".join(block["text"] for block in _blocks(kwargs))
+
+
+class StubMessages:
+    def __init__(self, client):
+        self.client = client
+
+    def _respond(self, kwargs):
+        """Record the call and work out its reply; returns (output, usage, seconds to sleep)."""
+        client = self.client
+        check_request(kwargs)
+        text = _message_text(kwargs)
+        # Prompt caching: the first request with a given prefix writes it, later ones read it.
+        prefix = _cached_prefix(kwargs)
+        cache_read = cache_write = 0
+        with client.lock:
+            client.calls.append(kwargs)
+            if prefix:
+                prefix_key = hashlib.sha256((kwargs.get("model", "") + prefix).encode("utf-8")).hexdigest()
+                if prefix_key in client.prompt_cache:
+                    cache_read = len(prefix) // 4
+                else:
+                    client.prompt_cache.add(prefix_key)
+                    cache_write = len(prefix) // 4
+            client.cache_read_tokens += cache_read
+            client.cache_write_tokens += cache_write
+        # Cached prefix tokens are not reprocessed, so a cache read shortens the call.
+        uncached = 1 - len(prefix) / len(text) if cache_read and client.cache_speedup else 1
+        delay = client.latency * max(uncached, 0.1)
+        quality = QUALITY_MARKER.search(text) if client.prompt_gain else None
+        if "you are Dr." in text:
+            output = REVIEW_RESPONSE.format(score=quality.group(1) if quality else client.score)
+        elif "expert prompt engineer" in text:
+            output = PROMPT_RESPONSE
+            if client.prompt_gain:
+                # The improved prompt is better or worse than the original by a random step
+                # seeded by the request text, so the same request always gets the same step.
+                # The prompt is tagged with its request, so prompts with different histories
+                # never collapse into the same text.
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                base = float(quality.group(1)) if quality else client.score
+                step = random.Random(digest).uniform(*client.prompt_gain)
+                output += f" [quality {min(10.0, max(0.0, round(base + step, 1)))}] [revision {digest[:12]}]"
+        elif "Write concise notes" in text:
+            output = NOTES_RESPONSE
+        else:
+            output = BLOG_RESPONSE + (f"\n\n{quality.group(0)}" if quality else "")
+        usage = SimpleNamespace(input_tokens=(len(text) - len(prefix)) // 4, output_tokens=len(output) // 4,
+                                cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write)
+        return output, usage, delay
+
+    def create(self, **kwargs):
+        output, usage, delay = self._respond(kwargs)
+        if delay:
+            time.sleep(delay)
+        return _message(output, usage)
+
+    def stream(self, **kwargs):
+        return StubStream(*self._respond(kwargs))
+
+
+def _message(output, usage):
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=output)], usage=usage)
+
+
+class StubStream:
+    """
+    Stand-in for the SDK's MessageStream context manager. text_stream yields the reply
+    word by word, with the call's delay spread evenly over the words, so the first text
+    arrives long before the whole reply would.
+    """
+
+    def __init__(self, output, usage, delay):
+        self.output = output
+        self.usage = usage
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        words = self.output.split(" ")
+        for i, word in enumerate(words):
+            if self.delay:
+                time.sleep(self.delay / len(words))
+            yield word if i == 0 else " " + word
+
+    def get_final_message(self):
+        return _message(self.output, self.usage)
+
+
+class StubAnthropic:
+    """
+    Drop-in for anthropic.Anthropic: every messages.create call sleeps `latency`
+    seconds and returns a canned response chosen from the prompt. Reviewers always
+    give `score`, so by default runs go through every iteration. Calls are recorded
+    in `calls`, and requests are checked with check_request().
+
+    Prompt caching is emulated: a request whose prefix (up to its last cache_control
+    block) was seen before reports it as cache_read_input_tokens and, with
+    cache_speedup, sleeps only for the uncached share of its text.
+
+    With prompt_gain=(low, high), each improved prompt scores a random step in that
+    range above (or below) the prompt it improves on, starting from `score`, and
+    reviewers give a post the score of the prompt that wrote it. Searching more
+    candidates per round then reaches a target score in fewer rounds.
+    """
+
+    def __init__(self, api_key=None, latency=0.0, score=7, cache_speedup=True, prompt_gain=None):
+        self.api_key = api_key
+        self.latency = latency
+        self.score = score
+        self.prompt_gain = prompt_gain
+        self.cache_speedup = cache_speedup
+        self.calls = []
+        self.prompt_cache = set()
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.lock = threading.Lock()
+        self.messages = StubMessages(self)
+
+
+def install(summarizer_module, latency=0.0, score=7, prompt_gain=None):
+    """Make the summarizer use one shared StubAnthropic; returns it so calls can be inspected."""
+    stub = StubAnthropic(latency=latency, score=score, prompt_gain=prompt_gain)
+    summarizer_module.Anthropic = lambda api_key=None, **kwargs: stub
+    summarizer_module._clients.clear()
+    return stub
@@ -0,0 +1,130 @@
+# benchmarks/synthetic.py
+"""Deterministic synthetic PubMed records, efetch XML and PDFs for benchmarks."""
+import random
+from xml.sax.saxutils import escape
+
+JOURNALS = ["N Engl J Med", "Nature", "JAMA", "Science", "Cell"]
+PUBLICATION_TYPES = ["Journal Article"] * 9 + ["Review"]
+
+# Words drawn from the ranking keyword list, mixed into filler text at roughly the
+# density seen in oncology abstracts.
+KEYWORD_WORDS = [
+    "RNA", "RNA-seq", "RNAseq", "biomarker", "prognosis", "prognostic", "marker", "markers",
+    "transcriptome", "expression", "signature", "survival", "cancer", "metastasis",
+    "dysregulated", "differential", "risk", "sequencing", "gene expression", "overall survival",
+    "hazard ratio", "Kaplan-Meier", "long noncoding RNA", "tumor progression", "mRNA expression",
+]
+FILLER_WORDS = [
+    "the", "of", "and", "in", "to", "we", "with", "patients", "cohort", "study", "clinical",
+    "treatment", "trial", "results", "analysis", "was", "were", "associated", "significantly",
+    "compared", "group", "cells", "protein", "response", "model", "data", "using", "increased",
+    "reduced", "years", "median", "follow-up", "randomized", "outcome", "primary", "endpoint",
+]
+KEYWORD_DENSITY = 0.04
+LAST_NAMES = ["Zhou", "Li", "Wang", "Smith", "Garcia", "Müller", "Kim", "Patel", "Rossi", "Nguyen",
+              "Cohen", "Silva", "Tanaka", "Johnson", "Brown", "Lee", "Chen", "Martin", "Ivanova", "Okafor"]
+FORE_NAMES = ["Wei", "Anna", "John", "Maria", "Hiro", "Priya", "Luca", "Chen", "Sara", "David"]
+
+
+def abstract_text(rng, words=220):
+    return " ".join(rng.choice(KEYWORD_WORDS) if rng.random() < KEYWORD_DENSITY else rng.choice(FILLER_WORDS)
+                    for _ in range(words)).capitalize() + "."
+
+
+def synthetic_article(pmid):
+    """The same PMID always yields the same article."""
+    rng = random.Random(pmid)
+    return {
+        "pmid": str(pmid),
+        "title": abstract_text(rng, rng.randint(8, 16)),
+        "abstract": abstract_text(rng, rng.randint(150, 300)),
+        "journal": rng.choice(JOURNALS),
+        "publication_year": str(rng.randint(2015, 2025)),
+        "authors": [f"{rng.choice(LAST_NAMES)}, {rng.choice(FORE_NAMES)}" for _ in range(rng.randint(3, 12))],
+        "publication_type": rng.choice(PUBLICATION_TYPES),
+    }
+
+
+def synthetic_papers(n, start=1):
+    """Article dicts (as produced by parse_pubmed_xml_to_json) for PMIDs start .. start + n - 1."""
+    for pmid in range(start, start + n):
+        article = synthetic_article(pmid)
+        del article["publication_type"]
+        yield article
+
+
+def article_xml(pmid):
+    article = synthetic_article(pmid)
+    authors = "".join(
+        f"<Author ValidYN=\"Y\"><LastName>{escape(last)}</LastName><ForeName>{escape(fore)}</ForeName></Author>"
+        for last, fore in (author.split(", ") for author in article["authors"]))
+    # Structured abstracts are split over several labelled AbstractText elements.
+    abstract = article["abstract"]
+    half = len(abstract) // 2
+    return (
+        "<PubmedArticle><MedlineCitation Status=\"MEDLINE\" Owner=\"NLM\">"
+        f"<PMID Version=\"1\">{article['pmid']}</PMID>"
+        "<Article PubModel=\"Print\"><Journal><JournalIssue CitedMedium=\"Internet\">"
+        f"<Volume>{pmid % 400}</Volume><Issue>{pmid % 12 + 1}</Issue>"
+        f"<PubDate><Year>{article['publication_year']}</Year><Month>Jan</Month></PubDate></JournalIssue>"
+        f"<Title>{escape(article['journal'])}</Title></Journal>"
+        f"<ArticleTitle>{escape(article['title'])}</ArticleTitle>"
+        f"<Abstract><AbstractText Label=\"BACKGROUND\">{escape(abstract[:half])}</AbstractText>"
+        f"<AbstractText Label=\"RESULTS\">{escape(abstract[half:])}</AbstractText></Abstract>"
+        f"<AuthorList CompleteYN=\"Y\">{authors}</AuthorList><Language>eng</Language>"
+        f"<PublicationTypeList><PublicationType UI=\"D016428\">{article['publication_type']}</PublicationType>"
+        "</PublicationTypeList></Article></MedlineCitation>"
+        "<PubmedData><PublicationStatus>ppublish</PublicationStatus></PubmedData></PubmedArticle>\n"
+    )
+
+
+XML_HEADER = (
+    "<?xml version=\"1.0\" ?>\n"
+    "<!DOCTYPE PubmedArticleSet PUBLIC \"-//NLM//DTD PubMedArticle, 1st January 2024//EN\" "
+    "\"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd\">\n"
+    "<PubmedArticleSet>\n"
+)
+XML_FOOTER = "</PubmedArticleSet>\n"
+
+
+def iter_efetch_xml(pmids):
+    """Yield an efetch response for the given PMIDs in pieces, one article at a time."""
+    yield XML_HEADER
+    for pmid in pmids:
+        yield article_xml(int(pmid))
+    yield XML_FOOTER
+
+
+def write_efetch_xml(path, n, start=1):
+    """Write an efetch response with n articles to `path` without holding it in memory."""
+    with open(path, "w", encoding="utf-8") as out:
+        for piece in iter_efetch_xml(range(start, start + n)):
+            out.write(piece)
+
+
+def make_pdf(pages, words_per_page=400):
+    """Build a minimal text PDF with the given number of pages."""
+    rng = random.Random(pages)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(f"{3 + 2 * i} 0 R" for i in range(pages)), pages),
+    ]
+    font_id = 3 + 2 * pages
+    for i in range(pages):
+        text = abstract_text(rng, words_per_page).replace("(", "").replace(")", "")
+        lines = "".join(f"({text[k:k + 90]}) Tj 0 -12 Td " for k in range(0, len(text), 90))
+        stream = f"BT /F1 9 Tf 30 770 Td {lines}ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
@@ -0,0 +1,114 @@
+# bm25.py
+import re
+from collections import defaultdict
+from itertools import count
+from typing import Dict, Iterable, List
+
+import numpy as np
+from scipy import sparse
+
+# Hyphenated words ("rna-seq", "kaplan-meier") stay single tokens, as in the keyword list.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index over a corpus of abstracts, scored with Okapi BM25.
+
+    The corpus is tokenized once. Terms are unigrams plus adjacent bigrams, so
+    two-word keywords can be matched as phrases. Each document's BM25 term
+    weights (idf * saturated tf, length normalised) are precomputed into a
+    sparse document-term matrix, so scoring a query is a single sparse
+    matrix-vector product instead of a pass over the raw text.
+    """
+
+    def __init__(self, documents: Iterable[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # Unseen tokens get the next free id on first lookup.
+        vocabulary = defaultdict(count().__next__)
+        token_ids = []
+        lengths = []
+        for text in documents:
+            ids = list(map(vocabulary.__getitem__, tokenize(text)))
+            token_ids.extend(ids)
+            lengths.append(len(ids))
+        self.vocabulary: Dict[str, int] = dict(vocabulary)
+        n_docs = len(lengths)
+        n_unigrams = len(self.vocabulary)
+
+        # Bigrams are numbered from the unigram id pairs, without building strings.
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        rows = np.repeat(np.arange(n_docs, dtype=np.int64), lengths)
+        same_doc = rows[1:] == rows[:-1]
+        pair_keys = token_ids[:-1][same_doc] * n_unigrams + token_ids[1:][same_doc]
+        self.bigram_keys, bigram_ids = np.unique(pair_keys, return_inverse=True)
+        columns = np.concatenate([token_ids, n_unigrams + bigram_ids.ravel()])
+        rows = np.concatenate([rows, rows[1:][same_doc]])
+        n_terms = n_unigrams + len(self.bigram_keys)
+
+        # Duplicate (row, term) entries are summed into term frequencies.
+        tf = sparse.coo_matrix((np.ones(len(columns), dtype=np.float32), (rows, columns)),
+                               shape=(n_docs, n_terms)).tocsr()
+        tf.sum_duplicates()
+        self.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        self.doc_freq = np.bincount(tf.indices, minlength=n_terms)
+        self.idf = np.log1p((n_docs - self.doc_freq + 0.5) / (self.doc_freq + 0.5)).astype(np.float32)
+
+        avgdl = self.doc_lengths.mean() if n_docs else 0.0
+        norm = k1 * (1 - b + b * self.doc_lengths / avgdl) if avgdl else np.full(n_docs, k1, dtype=np.float32)
+        # Repeat each document's length norm for its non-zero entries.
+        row_norm = np.repeat(norm, np.diff(tf.indptr))
+        tf.data = self.idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + row_norm)
+        self.weights = tf
+
+    def _bigram_column(self, first: str, second: str):
+        first_id = self.vocabulary.get(first)
+        second_id = self.vocabulary.get(second)
+        if first_id is None or second_id is None:
+            return None
+        key = first_id * len(self.vocabulary) + second_id
+        pos = int(np.searchsorted(self.bigram_keys, key))
+        if pos < len(self.bigram_keys) and self.bigram_keys[pos] == key:
+            return len(self.vocabulary) + pos
+        return None
+
+    def query_vector(self, keywords: List[str], boosts: Dict[str, float] = None) -> np.ndarray:
+        """
+        Build a query vector from a keyword list. Each keyword is weighted by its
+        boost (default 1). Single-word keywords map to their unigram. Longer phrases
+        are spread evenly over their bigrams.
+        """
+        boosts = boosts or {}
+        query = np.zeros(self.weights.shape[1], dtype=np.float32)
+        for keyword in keywords:
+            tokens = tokenize(keyword)
+            if not tokens:
+                continue
+            boost = boosts.get(keyword.lower(), 1)
+            if len(tokens) == 1:
+                columns = [self.vocabulary.get(tokens[0])]
+            else:
+                columns = [self._bigram_column(a, b) for a, b in zip(tokens, tokens[1:])]
+            for column in columns:
+                if column is not None:
+                    query[column] += boost / len(columns)
+        return query
+
+    def score(self, keywords: List[str], boosts: Dict[str, float] = None) -> np.ndarray:
+        """Return the BM25 score of every document for the given keywords."""
+        return self.weights @ self.query_vector(keywords, boosts)
+
+    def top_n(self, keywords: List[str], n: int, boosts: Dict[str, float] = None):
+        """Return (document index, score) pairs for the n best documents, best first."""
+        scores = self.score(keywords, boosts)
+        n = min(n, len(scores))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,264 @@
+# corpus.py
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Memory target for a Corpus, checked by `python -m benchmarks.run --only corpus`:
+# at most this many bytes per article on top of the UTF-8 size of its PMID, title
+# and abstract. A list of article dicts spends about 1 KB per article on top of that
+# (dict, per-field str headers, a str per author name), plus 2-4 bytes per character
+# for any abstract with non-Latin-1 text.
+BYTES_PER_ARTICLE_OVERHEAD_TARGET = 256
+
+FIELDS = ("pmid", "title", "abstract", "journal", "publication_year", "authors")
+
+# Snapshot file layout: a header of SNAPSHOT_MAGIC, the section count and one
+# (offset, byte length) pair per section, then the sections in SNAPSHOT_SECTIONS
+# order, each aligned to 8 bytes. A section is a Corpus buffer written as-is:
+# UTF-8 text or the raw items of an offsets/id array, in native byte order.
+SNAPSHOT_MAGIC = b"PMCORPS1"
+SNAPSHOT_SECTIONS = (
+    ("pmid_data", "B"), ("pmid_offsets", "q"),
+    ("title_data", "B"), ("title_offsets", "q"),
+    ("abstract_data", "B"), ("abstract_offsets", "q"),
+    ("string_data", "B"), ("string_offsets", "q"),
+    ("journal_ids", "I"), ("year_ids", "I"),
+    ("author_ids", "I"), ("author_offsets", "q"),
+)
+_SNAPSHOT_HEADER = struct.Struct("<8sQ")
+_SNAPSHOT_ENTRY = struct.Struct("<QQ")
+
+
+class TextColumn:
+    """Strings stored back to back as UTF-8 in one buffer, indexed by an offsets array."""
+
+    def __init__(self, data=None, offsets=None):
+        # A snapshot column is backed by read-only memoryviews of the mapped file.
+        self.data = bytearray() if data is None else data
+        self.offsets = array("q", [0]) if offsets is None else offsets
+
+    def append(self, text: str):
+        self.data += (text or "").encode("utf-8")
+        self.offsets.append(len(self.data))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        data = self.data
+        offsets = self.offsets
+        for i in range(len(offsets) - 1):
+            yield str(data[offsets[i]:offsets[i + 1]], "utf-8")
+
+
+class StringTable:
+    """Interns strings that repeat across articles (journals, years, author names) as integer ids."""
+
+    def __init__(self):
+        # A list, or a TextColumn for a snapshot, whose strings are decoded on access.
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def id(self, text: str) -> int:
+        text = text or ""
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+
+class Corpus:
+    """
+    Column-oriented store for the articles of a query, replacing a list of dicts.
+    PMIDs, titles and abstracts are UTF-8 text columns; journals, years and author
+    names are interned in a shared StringTable and referenced by id from arrays.
+
+    Indexing returns an article dict like those produced by parse_pubmed_xml_to_json,
+    built on demand, so code written for a list of dicts keeps working. Hot loops
+    should read single fields with column() or get() instead.
+
+    save() writes the columns to a snapshot file and Corpus.open() maps one back
+    read-only, without copying: opening takes constant time, and every process
+    that opens the same file shares its pages through the OS page cache.
+    """
+
+    def __init__(self):
+        self.pmids = TextColumn()
+        self.titles = TextColumn()
+        self.abstracts = TextColumn()
+        self.strings = StringTable()
+        self.journal_ids = array("I")
+        self.year_ids = array("I")
+        # Authors of article i are author_ids[author_offsets[i]:author_offsets[i + 1]].
+        self.author_ids = array("I")
+        self.author_offsets = array("q", [0])
+        # Set for a corpus opened from a snapshot: snapshot_version() of its file.
+        self.version = None
+
+    @classmethod
+    def from_papers(cls, papers: Iterable[Dict]) -> "Corpus":
+        corpus = cls()
+        corpus.extend(papers)
+        return corpus
+
+    def append(self, paper: Dict):
+        if self.version is not None:
+            raise TypeError("A corpus opened from a snapshot is read-only")
+        self.pmids.append(paper.get("pmid"))
+        self.titles.append(paper.get("title"))
+        self.abstracts.append(paper.get("abstract"))
+        self.journal_ids.append(self.strings.id(paper.get("journal")))
+        self.year_ids.append(self.strings.id(paper.get("publication_year")))
+        self.author_ids.extend(self.strings.id(author) for author in paper.get("authors") or [])
+        self.author_offsets.append(len(self.author_ids))
+
+    def extend(self, papers: Iterable[Dict]):
+        for paper in papers:
+            self.append(paper)
+
+    def __len__(self):
+        return len(self.journal_ids)
+
+    def _index(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("corpus index out of range")
+        return i
+
+    def get(self, i: int, field: str):
+        """One field of article i, without building the whole dict."""
+        i = self._index(i)
+        if field == "pmid":
+            return self.pmids[i]
+        if field == "title":
+            return self.titles[i]
+        if field == "abstract":
+            return self.abstracts[i]
+        if field == "journal":
+            return self.strings[self.journal_ids[i]]
+        if field == "publication_year":
+            return self.strings[self.year_ids[i]]
+        if field == "authors":
+            return [self.strings[author_id]
+                    for author_id in self.author_ids[self.author_offsets[i]:self.author_offsets[i + 1]]]
+        raise KeyError(field)
+
+    def __getitem__(self, i: int) -> Dict:
+        i = self._index(i)
+        return {field: self.get(i, field) for field in FIELDS}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def column(self, field: str) -> Iterator:
+        """Iterate one field across all articles, in order."""
+        if field == "pmid":
+            return iter(self.pmids)
+        if field == "title":
+            return iter(self.titles)
+        if field == "abstract":
+            return iter(self.abstracts)
+        return (self.get(i, field) for i in range(len(self)))
+
+    def save(self, path: str):
+        """Write a snapshot to `path`, replacing any existing file atomically."""
+        strings = self.strings.strings
+        if not isinstance(strings, TextColumn):
+            column = TextColumn()
+            for text in strings:
+                column.append(text)
+            strings = column
+        sections = (self.pmids.data, self.pmids.offsets, self.titles.data, self.titles.offsets,
+                    self.abstracts.data, self.abstracts.offsets, strings.data, strings.offsets,
+                    self.journal_ids, self.year_ids, self.author_ids, self.author_offsets)
+        buffers = [memoryview(section).cast("B") for section in sections]
+        header_size = _SNAPSHOT_HEADER.size + _SNAPSHOT_ENTRY.size * len(buffers)
+        entries = []
+        offset = header_size
+        for buffer in buffers:
+            offset += -offset % 8
+            entries.append((offset, buffer.nbytes))
+            offset += buffer.nbytes
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(buffers)))
+                for entry in entries:
+                    f.write(_SNAPSHOT_ENTRY.pack(*entry))
+                for (start, _), buffer in zip(entries, buffers):
+                    f.write(b"\0" * (start - f.tell()))
+                    f.write(buffer)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def open(cls, path: str) -> "Corpus":
+        """Map a snapshot written by save(). The corpus is read-only and shares the file's pages."""
+        with open(path, "rb") as f:
+            version = _version(os.fstat(f.fileno()))
+            if version[2] == 0:
+                raise ValueError(f"{path} is not a corpus snapshot")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, count = _SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or count != len(SNAPSHOT_SECTIONS):
+            raise ValueError(f"{path} is not a corpus snapshot")
+        sections = []
+        for n, (_, typecode) in enumerate(SNAPSHOT_SECTIONS):
+            start, length = _SNAPSHOT_ENTRY.unpack_from(view, _SNAPSHOT_HEADER.size + n * _SNAPSHOT_ENTRY.size)
+            sections.append(view[start:start + length].cast(typecode))
+        (pmid_data, pmid_offsets, title_data, title_offsets, abstract_data, abstract_offsets,
+         string_data, string_offsets, journal_ids, year_ids, author_ids, author_offsets) = sections
+        corpus = cls()
+        corpus.pmids = TextColumn(pmid_data, pmid_offsets)
+        corpus.titles = TextColumn(title_data, title_offsets)
+        corpus.abstracts = TextColumn(abstract_data, abstract_offsets)
+        corpus.strings.strings = TextColumn(string_data, string_offsets)
+        corpus.strings.ids = None
+        corpus.journal_ids = journal_ids
+        corpus.year_ids = year_ids
+        corpus.author_ids = author_ids
+        corpus.author_offsets = author_offsets
+        corpus.version = version
+        return corpus
+
+
+def _version(stat) -> Tuple[int, int, int]:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def snapshot_version(path: str) -> Optional[Tuple[int, int, int]]:
+    """Identify the file currently at `path`, to tell whether it was replaced; None if it is missing."""
+    try:
+        return _version(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+def column(papers, field: str) -> Iterator:
+    """Iterate one field across `papers`, which may be a Corpus or a list of article dicts."""
+    if isinstance(papers, Corpus):
+        return papers.column(field)
+    return (paper.get(field, "") for paper in papers)
+
+
+def field_value(papers, i: int, field: str):
+    """One field of the i-th article in a Corpus or a list of article dicts."""
+    if isinstance(papers, Corpus):
+        return papers.get(i, field)
+    return papers[i].get(field, "")
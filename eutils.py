@@ -0,0 +1,345 @@
+# eutils.py
+import gzip
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+
+
+
+class IncompleteResponse(Exception):
+    """A response that parsed but lacks what the caller needs, e.g. an <ERROR> body sent with a 200."""
+
+
+# Errors that a repeat of the same E-utilities call may not hit: connection failures,
+# timeouts, error statuses, response bodies cut off mid-stream and error bodies.
+TRANSIENT_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError, OSError, IncompleteResponse)
+# 4xx statuses that still mean "try again later".
+RETRYABLE_CLIENT_STATUSES = (408, 429)
+
+
+def _retryable(error) -> bool:
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return not 400 <= response.status_code < 500 or response.status_code in RETRYABLE_CLIENT_STATUSES
+    return True
+
+
+def _retry_after(error) -> float:
+    """Seconds the server asked us to wait in a Retry-After header, or 0."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("Retry-After", 0)) if response is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+def retry(call, errors=TRANSIENT_ERRORS, attempts=4, base_delay=1.0, max_delay=60.0, stop=None, on_retry=None):
+    """
+    Return call(), calling it up to `attempts` times while it raises one of `errors`.
+    The n-th retry waits between half and all of base_delay * 2**n seconds (capped at
+    max_delay), or longer if the server sent Retry-After. Client errors other than
+    408 and 429 are raised at once, as is the last error once `stop` is set.
+    on_retry(error, delay) is called before each wait.
+    """
+    for attempt in range(attempts):
+        try:
+            return call()
+        except errors as e:
+            if attempt == attempts - 1 or not _retryable(e) or (stop is not None and stop.is_set()):
+                raise
+            ceiling = min(max_delay, base_delay * 2 ** attempt)
+            delay = max(random.uniform(ceiling / 2, ceiling), _retry_after(e))
+            if on_retry is not None:
+                on_retry(e, delay)
+            if stop is not None:
+                if stop.wait(delay):
+                    raise
+            else:
+                time.sleep(delay)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every E-utilities call. acquire() blocks
+    until a token is free, so concurrent workers together never exceed `rate`
+    requests per second.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is free. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class _TimedReader:
+    """
+    File-like wrapper that adds up the time spent in read(), i.e. waiting on the source.
+    A caller that has checked the body (e.g. parsed it to the end) calls mark_valid(),
+    which allows a response without a Content-Length to be cached.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.read_seconds = 0.0
+        self.valid = False
+
+    def mark_valid(self):
+        self.valid = True
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        try:
+            return self.source.read(size)
+        finally:
+            self.read_seconds += time.perf_counter() - start
+
+
+class _CachingReader:
+    """
+    File-like wrapper that copies everything read from `source` into a gzip temp
+    file. The entry is published to the cache only if the source is read to EOF
+    and the caller confirms the body is whole, so neither an aborted download nor
+    a connection dropped mid-response leaves a truncated entry behind.
+    """
+
+    def __init__(self, cache, key, source):
+        self.cache = cache
+        self.key = key
+        self.source = source
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.directory, suffix=".tmp")
+        self.tmp = gzip.GzipFile(fileobj=os.fdopen(fd, "wb"), mode="wb", compresslevel=cache.compresslevel)
+        self.complete = False
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.tmp.write(data)
+        if not data or size is None or size < 0:
+            self.complete = True
+        return data
+
+    def close(self, publish=True):
+        fileobj = self.tmp.fileobj
+        self.tmp.close()
+        fileobj.close()
+        if self.complete and publish:
+            self.cache._publish(self.key, self.tmp_path)
+        else:
+            os.remove(self.tmp_path)
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of gzip-compressed E-utilities responses.
+    Entries are keyed by a hash of the request, expire after `ttl` seconds, and
+    the least recently used ones are evicted once the cache exceeds `max_bytes`.
+    File mtime records when an entry was written and atime when it was last read.
+    """
+
+    def __init__(self, directory: str, ttl: float = 3600, max_bytes: int = 1 << 30, compresslevel: int = 6):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(method, endpoint, params) -> str:
+        request_repr = json.dumps([method, endpoint, sorted((k, str(v)) for k, v in params.items())])
+        return hashlib.sha256(request_repr.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".gz")
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".gz"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_atime
+
+    def open(self, key):
+        """Return a readable file for a fresh entry, or None on a miss."""
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stat.st_mtime > self.ttl:
+            self._remove(path)
+            return None
+        # Mark as recently used without touching the write time used for the TTL.
+        os.utime(path, (now, stat.st_mtime))
+        try:
+            return gzip.open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+    def wrap(self, key, source):
+        """Wrap a response stream so that reading it to the end stores it under `key`."""
+        return _CachingReader(self, key, source)
+
+    def discard(self, key):
+        """Drop the entry for `key`, if any."""
+        self._remove(self._path(key))
+
+    def _publish(self, key, tmp_path):
+        path = self._path(key)
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            if os.path.exists(path):
+                self.total_bytes -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path):
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            self.total_bytes -= size
+
+    def _evict(self):
+        # Caller holds self.lock.
+        for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            for path, _, _ in list(self._entries()):
+                os.remove(path)
+            self.total_bytes = 0
+
+
+class EutilsClient:
+    """
+    E-utilities client with a pooled keep-alive session, a shared rate limiter
+    and an optional response cache. Cache hits are served from disk without
+    taking a rate-limit token.
+    """
+
+    def __init__(self, base_url: str, limiter: TokenBucket, cache: ResponseCache = None,
+                 api_key: str = None, pool_size: int = 10):
+        self.base_url = base_url
+        self.limiter = limiter
+        self.cache = cache
+        self.api_key = api_key
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @contextmanager
+    def open(self, endpoint, params, method="GET"):
+        """
+        Yield the response body of an E-utilities call as a binary file-like object.
+        POST sends `params` as a form body, for requests too large for a URL. The
+        body's `read_seconds` is the time spent reading it, so callers parsing the
+        stream can separate their own time from the network's.
+
+        A fresh response is cached only if the caller does not fail on it and either its
+        length matches its Content-Length or the caller calls body.mark_valid(). A cached
+        response the caller fails on is dropped, so a retry goes back to the network.
+        """
+        key = ResponseCache.key(method, endpoint, params) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.open(key)
+            metrics.cache_lookup("eutils", cached is not None)
+            if cached is not None:
+                with cached:
+                    try:
+                        yield _TimedReader(cached)
+                    except Exception:
+                        self.cache.discard(key)
+                        raise
+                return
+        if self.api_key:
+            params = dict(params, api_key=self.api_key)
+        metrics.PUBMED_WAIT_SECONDS.observe(self.limiter.acquire())
+        url = f"{self.base_url}/{endpoint}"
+        start = time.perf_counter()
+        if method == "POST":
+            response = self.session.post(url, data=params, stream=True)
+        else:
+            response = self.session.get(url, params=params, stream=True)
+        latency = time.perf_counter() - start
+        with response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            source = response.raw if key is None else self.cache.wrap(key, response.raw)
+            body = _TimedReader(source)
+            failed = False
+            try:
+                yield body
+            except Exception:
+                failed = True
+                raise
+            finally:
+                if key is not None:
+                    # A body cut off mid-stream still ends in EOF, so that alone does not prove it whole.
+                    expected = response.headers.get("Content-Length")
+                    length_ok = expected is not None and expected.isdigit() and response.raw.tell() == int(expected)
+                    source.close(publish=not failed and (body.valid or length_ok))
+                metrics.PUBMED_REQUEST_SECONDS.observe(latency + body.read_seconds,
+                                                       endpoint=endpoint.split(".")[0])
+
+    def fetch_text(self, endpoint, params, method="GET") -> str:
+        with self.open(endpoint, params, method=method) as body:
+            return body.read().decode("utf-8")
+
+    def fetch_xml(self, endpoint, params, method="GET", required=()) -> ET.Element:
+        """
+        Fetch and parse an XML response. Raises IncompleteResponse if any of the `required`
+        element paths is missing or empty; the response is cached only if it passes.
+        """
+        with self.open(endpoint, params, method=method) as body:
+            root = ET.fromstring(body.read())
+            missing = [path for path in required if not (root.findtext(path) or "").strip()]
+            if missing:
+                error = root.findtext(".//ERROR")
+                raise IncompleteResponse(f"{endpoint} response has no {', '.join(missing)}"
+                                         + (f": {error}" if error else ""))
+            body.mark_valid()
+            return root
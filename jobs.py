@@ -0,0 +1,162 @@
+# jobs.py
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT,
+    status TEXT,
+    error TEXT,
+    created REAL,
+    updated REAL,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT,
+    seq INTEGER,
+    event TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+# Columns added after the first release, for databases created before them.
+MIGRATIONS = (("owner", "TEXT"), ("heartbeat", "REAL"))
+
+# Job states; "interrupted" marks jobs whose process stopped before they finished.
+QUEUED, RUNNING, DONE, FAILED, INTERRUPTED = "queued", "running", "done", "failed", "interrupted"
+FINISHED_STATES = (DONE, FAILED, INTERRUPTED)
+
+
+class JobManager:
+    """
+    Runs streaming tasks (generators of event strings, such as summarization_stream)
+    on a bounded worker pool. Every emitted event is persisted in SQLite with its
+    sequence number, so clients can poll, or reconnect and resume from an offset,
+    independently of the request that started the job.
+
+    Several processes (e.g. gunicorn workers) may share the database. Each job is
+    leased to the process that submitted it, which renews the lease every
+    lease_seconds / 3; a queued or running job whose lease has lapsed belonged to a
+    process that died, and is marked interrupted. Finished jobs and their events are
+    deleted retention_seconds after they finish.
+    """
+
+    def __init__(self, path: str, max_workers: int = 2, lease_seconds: float = 60.0,
+                 retention_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        # Notified whenever any job emits an event or finishes.
+        self.changed = threading.Condition(self.lock)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in MIGRATIONS:
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._maintain()
+        threading.Thread(target=self._maintain_forever, daemon=True).start()
+
+    def _maintain(self):
+        """Renew this process's leases, interrupt jobs whose lease lapsed and prune old finished jobs."""
+        now = time.time()
+        with self.changed, self.conn:
+            self.conn.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN (?, ?)",
+                              (now, self.owner, QUEUED, RUNNING))
+            interrupted = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE status IN (?, ?) AND (heartbeat IS NULL OR heartbeat < ?)",
+                (INTERRUPTED, now, QUEUED, RUNNING, now - self.lease_seconds)).rowcount
+            expired = [row[0] for row in self.conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?, ?) AND updated < ?",
+                (*FINISHED_STATES, now - self.retention_seconds))]
+            self.conn.executemany("DELETE FROM job_events WHERE job_id = ?", [(job_id,) for job_id in expired])
+            self.conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+            if interrupted or expired:
+                self.changed.notify_all()
+
+    def _maintain_forever(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self._maintain()
+            except sqlite3.Error:
+                # Another process holding the write lock; the lease still has two renewals to go.
+                pass
+
+    def submit(self, kind: str, task, *args) -> str:
+        """Queue task(*args) and return its job ID. The task must return an iterable of event strings."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO jobs (id, kind, status, error, created, updated, owner, heartbeat) "
+                              "VALUES (?, ?, ?, NULL, ?, ?, ?, ?)", (job_id, kind, QUEUED, now, now, self.owner, now))
+        self.executor.submit(self._run, job_id, task, args)
+        return job_id
+
+    def _set_status(self, job_id, status, error=None):
+        with self.changed, self.conn:
+            self.conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                              (status, error, time.time(), job_id))
+            self.changed.notify_all()
+
+    def _run(self, job_id, task, args):
+        self._set_status(job_id, RUNNING)
+        seq = 0
+        try:
+            for event in task(*args):
+                with self.changed, self.conn:
+                    self.conn.execute("INSERT INTO job_events VALUES (?, ?, ?)", (job_id, seq, event))
+                    self.changed.notify_all()
+                seq += 1
+        except Exception as e:
+            self._set_status(job_id, FAILED, str(e))
+            return
+        self._set_status(job_id, DONE)
+
+    def status(self, job_id: str) -> Dict:
+        with self.lock:
+            row = self.conn.execute("SELECT kind, status, error, created, updated FROM jobs WHERE id = ?",
+                                    (job_id,)).fetchone()
+            if row is None:
+                return None
+            event_count = self.conn.execute("SELECT COUNT(*) FROM job_events WHERE job_id = ?",
+                                            (job_id,)).fetchone()[0]
+        kind, status, error, created, updated = row
+        return {"job_id": job_id, "kind": kind, "status": status, "error": error,
+                "created": created, "updated": updated, "events": event_count}
+
+    def events(self, job_id: str, offset: int = 0) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute("SELECT event FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq",
+                                     (job_id, offset)).fetchall()
+        return [row[0] for row in rows]
+
+    def follow(self, job_id: str, offset: int = 0, poll_interval: float = 1.0):
+        """Yield the job's events from `offset` on, waiting for new ones until the job finishes."""
+        while True:
+            events = self.events(job_id, offset)
+            for event in events:
+                yield event
+            offset += len(events)
+            status = self.status(job_id)
+            if status is None:
+                return
+            if status["status"] in FINISHED_STATES:
+                # Pick up anything emitted between the read above and the status check.
+                yield from self.events(job_id, offset)
+                return
+            with self.changed:
+                self.changed.wait(poll_interval)
@@ -0,0 +1,238 @@
+# metrics.py
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# Prometheus' default latency buckets, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# LLM calls take seconds to minutes.
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Every metric defined in the process, in definition order, for render().
+_registry = []
+
+# Timing collector of the request currently being served, if it asked for one.
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_key(labelnames, labels) -> Tuple[str, ...]:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=()) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        timings = _current.get()
+        if timings is not None:
+            timings.add(self.name, self.labelnames, key, amount, counted=False)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [per-bucket counts, sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+        timings = _current.get()
+        if timings is not None:
+            timings.add(self.name, self.labelnames, key, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (bucket_counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """
+    Per-request view of the same measurements: while a request is tracked (see
+    track()), every histogram observation and counter increment it causes is also
+    added here, so the request can report where its time and tokens went.
+    """
+
+    def __init__(self):
+        # (metric name, label text) -> [count, total]
+        self.values: Dict[Tuple[str, str], list] = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, labelnames, key, value, counted=True):
+        label_text = ",".join(f"{n}={v}" for n, v in zip(labelnames, key))
+        with self.lock:
+            entry = self.values.setdefault((name, label_text), [0, 0])
+            entry[0] += 1 if counted else 0
+            entry[1] += value
+
+    def as_dict(self) -> Dict[str, Dict]:
+        with self.lock:
+            items = sorted(self.values.items())
+        result = {}
+        for (name, label_text), (count, total) in items:
+            key = f"{name}{{{label_text}}}" if label_text else name
+            result[key] = {"count": count, "total": round(total, 6)} if count else {"total": total}
+        return result
+
+    def summary(self) -> str:
+        parts = []
+        with self.lock:
+            items = sorted(self.values.items())
+        for (name, label_text), (count, total) in items:
+            label = f"[{label_text}]" if label_text else ""
+            if count:
+                parts.append(f"{name.replace('_seconds', '')}{label}: {count} x {total:.3f}s")
+            else:
+                parts.append(f"{name.replace('_total', '')}{label}: {total:g}")
+        return "Timing summary: " + ("; ".join(parts) if parts else "nothing recorded")
+
+
+def track(events, timings: RequestTimings):
+    """Yield from the `events` generator, attributing whatever each step records to `timings`."""
+    try:
+        while True:
+            token = _current.set(timings)
+            try:
+                event = next(events)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield event
+    finally:
+        events.close()
+
+
+def in_context(fn):
+    """
+    Wrap fn so that, when run on a worker thread, it records into the calling
+    request's timings. Returns fn unchanged if no request is being tracked.
+    """
+    timings = _current.get()
+    if timings is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+# ---------------------------
+# Application metrics
+# ---------------------------
+PUBMED_REQUEST_SECONDS = Histogram(
+    "pubmed_request_seconds", "E-utilities request time, from sending the request to reading the last byte.",
+    ["endpoint"])
+PUBMED_WAIT_SECONDS = Histogram(
+    "pubmed_rate_limit_wait_seconds", "Time spent waiting for the E-utilities rate limiter.")
+PUBMED_RETRIES = Counter(
+    "pubmed_retries_total", "E-utilities calls repeated after an error, by endpoint.", ["endpoint"])
+PUBMED_FAILED_RECORDS = Counter(
+    "pubmed_failed_records_total", "Records left unfetched after every retry and batch split failed.")
+PUBMED_PARSE_SECONDS = Histogram(
+    "pubmed_parse_seconds", "Time parsing one efetch response, excluding time spent reading it.")
+INGEST_SCORE_SECONDS = Histogram(
+    "ingest_score_seconds", "Time scoring one batch of articles as a query stores it.")
+RANK_SECONDS = Histogram(
+    "rank_seconds", "Time to score a corpus and pick the top papers.", ["method"])
+PDF_EXTRACT_SECONDS = Histogram(
+    "pdf_extract_seconds", "Time to extract the text of one PDF.", buckets=LLM_BUCKETS)
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_seconds", "Anthropic API call time by role.", ["role"], buckets=LLM_BUCKETS)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_first_token_seconds", "Time from sending a streamed Anthropic API call to its first text.",
+    ["role"], buckets=LLM_BUCKETS)
+LLM_WAIT_SECONDS = Histogram(
+    "llm_wait_seconds", "Time an LLM call waited for the rate limiter and a concurrency slot.", ["role"])
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens reported by the Anthropic API, by role and direction "
+    "(input, output, cache_read, cache_write).", ["role", "direction"])
+LLM_ERRORS = Counter(
+    "llm_errors_total", "Anthropic API calls that raised an error, by role.", ["role"])
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"])
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
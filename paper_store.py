@@ -0,0 +1,152 @@
+# paper_store.py
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+# SQLite caps the number of bound parameters per statement; stay well below it.
+SQL_CHUNK_SIZE = 900
+# Rows read per query when streaming the whole store.
+SCAN_PAGE_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    pmid TEXT PRIMARY KEY,
+    title TEXT,
+    abstract TEXT,
+    journal TEXT,
+    publication_year TEXT,
+    authors TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_papers_journal ON papers (journal);
+CREATE INDEX IF NOT EXISTS idx_papers_year ON papers (publication_year);
+-- PMIDs that efetch returned but that are not journal articles, so they are not fetched again.
+CREATE TABLE IF NOT EXISTS skipped_pmids (
+    pmid TEXT PRIMARY KEY
+);
+-- Record ranges already fetched by a paged (esearch history) harvest, so an
+-- interrupted one resumes where it stopped. `total` is the esearch count: once it
+-- changes, the offsets no longer line up and the checkpoint is dropped.
+CREATE TABLE IF NOT EXISTS fetch_checkpoints (
+    query TEXT,
+    total INTEGER,
+    retstart INTEGER,
+    retmax INTEGER,
+    pmids TEXT,
+    PRIMARY KEY (query, retstart)
+);
+"""
+
+
+def _chunks(items: List[str], size: int = SQL_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _row_to_paper(row) -> Dict:
+    pmid, title, abstract, journal, publication_year, authors = row
+    return {
+        "pmid": pmid,
+        "title": title,
+        "abstract": abstract,
+        "journal": journal,
+        "publication_year": publication_year,
+        "authors": json.loads(authors) if authors else []
+    }
+
+
+class PaperStore:
+    """
+    Persistent PubMed article store backed by SQLite and keyed by PMID.
+    A single connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            # WAL lets several worker processes read while one writes.
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    def known_pmids(self, pmids: Iterable[str]) -> Set[str]:
+        """Return the subset of `pmids` that is already stored or was skipped before."""
+        pmids = list(pmids)
+        known = set()
+        with self.lock:
+            for chunk in _chunks(pmids):
+                placeholders = ",".join("?" * len(chunk))
+                for table in ("papers", "skipped_pmids"):
+                    rows = self.conn.execute(
+                        f"SELECT pmid FROM {table} WHERE pmid IN ({placeholders})", chunk)
+                    known.update(row[0] for row in rows)
+        return known
+
+    def add_papers(self, papers: List[Dict]):
+        rows = [(p["pmid"], p["title"], p["abstract"], p["journal"],
+                 p["publication_year"], json.dumps(p["authors"])) for p in papers]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def mark_skipped(self, pmids: Iterable[str]):
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO skipped_pmids VALUES (?)",
+                                  [(pmid,) for pmid in pmids])
+
+    def load_checkpoint(self, query: str, total: int) -> Dict[int, Tuple[int, List[str]]]:
+        """Return {retstart: (retmax, pmids)} for ranges of `query` already fetched at this total."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM fetch_checkpoints WHERE query = ? AND total != ?", (query, total))
+            rows = self.conn.execute("SELECT retstart, retmax, pmids FROM fetch_checkpoints WHERE query = ?",
+                                     (query,)).fetchall()
+        return {retstart: (retmax, json.loads(pmids)) for retstart, retmax, pmids in rows}
+
+    def save_checkpoint(self, query: str, total: int, retstart: int, retmax: int, pmids: List[str]):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO fetch_checkpoints VALUES (?, ?, ?, ?, ?)",
+                              (query, total, retstart, retmax, json.dumps(pmids)))
+
+    def clear_checkpoint(self, query: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM fetch_checkpoints WHERE query = ?", (query,))
+
+    def iter_papers(self, pmids: Iterable[str]) -> Iterator[Dict]:
+        """
+        Yield stored papers for `pmids`, in the order given; unknown PMIDs are left out.
+        Rows are read SQL_CHUNK_SIZE at a time, so only one chunk is held in memory.
+        """
+        for chunk in _chunks(list(pmids)):
+            placeholders = ",".join("?" * len(chunk))
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT * FROM papers WHERE pmid IN ({placeholders})", chunk).fetchall()
+            found = {row[0]: row for row in rows}
+            for pmid in chunk:
+                if pmid in found:
+                    yield _row_to_paper(found[pmid])
+
+    def get_papers(self, pmids: Iterable[str]) -> List[Dict]:
+        """Return stored papers for `pmids`, in the order given. Unknown PMIDs are left out."""
+        return list(self.iter_papers(pmids))
+
+    def iter_all_papers(self) -> Iterator[Dict]:
+        """Yield every stored paper in insertion order, SCAN_PAGE_SIZE rows per query."""
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT rowid, * FROM papers WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, SCAN_PAGE_SIZE)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _row_to_paper(row[1:])
+            last_rowid = rows[-1][0]
+
+    def all_papers(self) -> List[Dict]:
+        return list(self.iter_all_papers())
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
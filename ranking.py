@@ -0,0 +1,190 @@
+# ranking.py
+import base64
+import heapq
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from corpus import Corpus
+
+# Number of distinct filters whose matching rank positions are kept per Ranking.
+FILTER_CACHE_SIZE = 64
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed, belongs to another query, or predates the current corpus."""
+
+
+def _year(text: str) -> int:
+    return int(text) if text and text.isdigit() else 0
+
+
+class Ranking:
+    """
+    Every scored paper of a corpus, sorted best first, with the journal and year of
+    each rank position alongside. It is built once per corpus, scoring method and
+    keyword list. A page is then a slice of the sorted arrays. A filter selects rank
+    positions from per-journal position lists, or with a vectorized year mask, and
+    the result is cached. Paging and repeated filters never rescore anything.
+
+    Ties are broken by corpus order (earlier articles first).
+    """
+
+    def __init__(self, corpus: Corpus, rows: np.ndarray, scores: np.ndarray):
+        order = np.lexsort((rows, -scores))
+        self.corpus = corpus
+        # Rank r is the paper at corpus position positions[r], with score scores[r].
+        self.positions = rows[order]
+        self.scores = scores[order]
+        journal_ids = np.frombuffer(corpus.journal_ids, dtype=np.uint32).copy()
+        year_ids = np.frombuffer(corpus.year_ids, dtype=np.uint32).copy()
+        self.journals = journal_ids[self.positions]
+        # Parse each distinct year string once; the string table also holds every author name.
+        year_string_ids, year_index = np.unique(year_ids[self.positions], return_inverse=True)
+        self.years = np.array([_year(corpus.strings[int(string_id)]) for string_id in year_string_ids],
+                              dtype=np.int32)[year_index]
+        # Journal name (lowercased) -> string id, and string id -> its rank positions, ascending.
+        self.journal_ids = {}
+        for journal_id in np.unique(self.journals):
+            self.journal_ids.setdefault(corpus.strings[int(journal_id)].lower(), []).append(int(journal_id))
+        by_journal = np.argsort(self.journals, kind="stable")
+        bounds = np.searchsorted(self.journals[by_journal], np.unique(self.journals), side="left")
+        self.journal_ranks = {int(journal_id): ranks for journal_id, ranks in
+                              zip(np.unique(self.journals), np.split(by_journal, bounds[1:]))}
+        # Identifies this ranking in cursors, so a cursor from an older corpus is rejected.
+        self.token = uuid.uuid4().hex
+        self._filtered = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def filtered(self, journals: Iterable[str] = None, year_from: int = None, year_to: int = None) -> Optional[np.ndarray]:
+        """Rank positions matching the filter, in rank order, or None when nothing is filtered."""
+        journals = tuple(sorted({journal.lower() for journal in journals})) if journals else ()
+        if not journals and year_from is None and year_to is None:
+            return None
+        key = (journals, year_from, year_to)
+        with self._lock:
+            ranks = self._filtered.get(key)
+            if ranks is not None:
+                self._filtered.move_to_end(key)
+                return ranks
+        if journals:
+            parts = [self.journal_ranks[journal_id] for journal in journals
+                     for journal_id in self.journal_ids.get(journal, ())]
+            ranks = np.sort(np.concatenate(parts)) if len(parts) > 1 else (parts[0] if parts else np.zeros(0, np.int64))
+            years = self.years[ranks]
+        else:
+            ranks = None
+            years = self.years
+        if year_from is not None or year_to is not None:
+            mask = np.ones(len(years), dtype=bool)
+            if year_from is not None:
+                mask &= years >= year_from
+            if year_to is not None:
+                mask &= years <= year_to
+            ranks = np.flatnonzero(mask) if ranks is None else ranks[mask]
+        with self._lock:
+            self._filtered[key] = ranks
+            if len(self._filtered) > FILTER_CACHE_SIZE:
+                self._filtered.popitem(last=False)
+        return ranks
+
+    def page(self, offset: int, limit: int, **filters) -> Tuple[List[Tuple[int, float]], int]:
+        """Return ([(corpus position, score), ...] for one page, total matching papers)."""
+        ranks = self.filtered(**filters)
+        if ranks is None:
+            total = len(self.positions)
+            selected = np.arange(offset, min(offset + limit, total))
+        else:
+            total = len(ranks)
+            selected = ranks[offset:offset + limit]
+        return [(int(self.positions[r]), float(self.scores[r])) for r in selected], total
+
+
+def encode_cursor(ranking: Ranking, query: Dict, offset: int) -> str:
+    payload = json.dumps({"t": ranking.token, "q": query, "o": offset}, sort_keys=True, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, ranking: Ranking, query: Dict) -> int:
+    """Return the offset a cursor points at, checking it belongs to this ranking and query."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        token, cursor_query, offset = payload["t"], payload["q"], int(payload["o"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+    if offset < 0:
+        raise InvalidCursor("Malformed cursor: negative offset")
+    if token != ranking.token:
+        raise InvalidCursor("Cursor is from an earlier query; start again without a cursor.")
+    if cursor_query != query:
+        raise InvalidCursor("Cursor was issued for different ranking parameters.")
+    return offset
+
+
+class IngestScores:
+    """
+    Scores articles as a query stores them, so the query's ranking is ready when it
+    finishes. Several fetch threads can add() at once. Alongside the scores, the
+    top_n best articles seen so far are kept for live progress reports.
+
+    Only articles with an abstract are scored, as in a Ranking.
+    """
+
+    def __init__(self, score: Callable[[str], float], top_n: int = 5):
+        self.score = score
+        self.top_n = top_n
+        self.scores: Dict[str, float] = {}
+        # Min-heap of (score, title, pmid) for the best top_n articles so far.
+        self.top = []
+        # Bumped whenever `top` changes, so a reporter can tell whether it has news.
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def add(self, papers: Iterable[Dict]):
+        for paper in papers:
+            pmid = paper.get("pmid")
+            abstract = paper.get("abstract")
+            if not abstract or pmid in self.scores:
+                continue
+            score = self.score(abstract)
+            entry = (score, paper.get("title") or "", pmid)
+            with self._lock:
+                self.scores[pmid] = score
+                if len(self.top) < self.top_n:
+                    heapq.heappush(self.top, entry)
+                elif score > self.top[0][0]:
+                    heapq.heapreplace(self.top, entry)
+                else:
+                    continue
+                self.version += 1
+
+    def best(self) -> List[Tuple[float, str, str]]:
+        """(score, title, pmid) of the best articles so far, best first."""
+        with self._lock:
+            return sorted(self.top, reverse=True)
+
+    def ranking(self, corpus: Corpus) -> Ranking:
+        """
+        The Ranking of `corpus` from the scores gathered so far. Articles with an
+        abstract that were not added (e.g. a journal's fetch failed part way) are
+        scored now.
+        """
+        # Abstract lengths come from the offsets, so abstracts are decoded only to score a straggler.
+        has_abstract = np.diff(np.frombuffer(corpus.abstracts.offsets, dtype=np.int64)) > 0
+        rows = []
+        scores = []
+        for position, pmid in enumerate(corpus.column("pmid")):
+            if not has_abstract[position]:
+                continue
+            score = self.scores.get(pmid)
+            rows.append(position)
+            scores.append(self.score(corpus.get(position, "abstract")) if score is None else score)
+        return Ranking(corpus, np.asarray(rows, dtype=np.int64), np.asarray(scores, dtype=np.float64))
@@ -1,18 +1,77 @@
 # summarizer.py
 from io import BytesIO
 import PyPDF2
+import hashlib
 import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from anthropic import Anthropic  # Ensure anthropic package is installed
 
+import metrics
+from eutils import TokenBucket
+from llm_cache import LLMCache, cache_key
+
 # Configuration variables for summarization
 # API_KEY will be passed as parameter to functions that need it
-MODEL_NAME = "claude-3-sonnet-20240229"
+# Prompt caching (PAPER_CACHE_CONTROL) only takes effect on models that support it,
+# which the original claude-3-sonnet-20240229 does not.
+MODEL_NAME = os.environ.get("ANTHROPIC_MODEL", "claude-sonnet-4-5")
 MAX_TOKENS = 1024
 TARGET_SCORE = 9 
 MAX_ITERATIONS = 6
 
+# Beam search over prompts. With BEAM_WIDTH > 1, every round after the first asks for
+# BEAM_WIDTH improved versions of the best prompt so far at once, then writes and
+# reviews a post for each, BEAM_CONCURRENCY candidates at a time (0: all of them; their
+# calls still share LLM_CONCURRENCY). The best post is kept. The search stops early once the best
+# score has gained less than BEAM_MIN_GAIN for BEAM_PATIENCE rounds in a row.
+# BEAM_WIDTH = 1 refines a single prompt per round.
+BEAM_WIDTH = int(os.environ.get("BEAM_WIDTH", 1))
+BEAM_CONCURRENCY = int(os.environ.get("BEAM_CONCURRENCY", 0))
+BEAM_PATIENCE = int(os.environ.get("BEAM_PATIENCE", 2))
+BEAM_MIN_GAIN = 0.25
+
+# Persistent cache of LLM responses and completed runs; set LLM_CACHE_PATH="" to disable.
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10000))
+llm_cache = LLMCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES) if LLM_CACHE_PATH else None
+
+# Global limits on Anthropic API calls, shared by every run and batch in the process.
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", 4))
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 50))
+llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+llm_rate_limiter = TokenBucket(LLM_REQUESTS_PER_MINUTE / 60, capacity=LLM_CONCURRENCY)
+
+# PDFs with at least this many pages are extracted on a process pool, PDF_PAGES_PER_TASK pages per task.
+PDF_PARALLEL_MIN_PAGES = 20
+PDF_PAGES_PER_TASK = 8
+PDF_WORKERS = os.cpu_count() or 1
+
+# Papers whose reduced text is longer than INPUT_CHAR_BUDGET (~15k tokens) are summarized
+# in PAPER_CHUNK_CHARS chunks, CHUNK_WORKERS at a time, and the notes are merged.
+INPUT_CHAR_BUDGET = 60000
+PAPER_CHUNK_CHARS = 20000
+CHUNK_WORKERS = 4
+
+# ask_claude returns failures as text starting with this prefix; they are never cached.
+ERROR_PREFIX = "Error occurred: "
+
+# Writer calls send the paper first, marked as a prompt-cache breakpoint, and the
+# prompt after it. Every iteration on the same paper then reads the paper from
+# Anthropic's prompt cache and pays full price only for the changed prompt.
+PAPER_CACHE_CONTROL = {"type": "ephemeral"}
+
+# Blog posts are streamed to the client as blog_delta messages, at most one per this
+# many seconds (each message is persisted as a job event).
+BLOG_DELTA_INTERVAL = 0.1
+
 REVIEWER_PROMPT_1 = (
     "For this conversation, you are Dr. Zhou, a practicing physician with 8 years experience at a major 三甲 hospital in Beijing, China. "
     "You are in the urology department, and you primarily treat prostate and bladder cancer patients. You are too busy to lead independent research, "
@@ -34,37 +93,259 @@ REVIEWER_PROMPT_2 =(
     "(c) inspiring approach for potential research collaborations, and (d) trustworthy and credible."
 )
 
+# Every reviewer persona scores each summary; reviews run concurrently.
+REVIEWER_PROMPTS = [REVIEWER_PROMPT_1, REVIEWER_PROMPT_2]
 
 INITIAL_PROMPT = (
     "Write a generally accessible blog post about the following scientific paper that is engaging and interesting, "
     "focusing on the key findings and clinical implications related to RNA markers and more: Keep it between 500-800 words."
 )
 
-def pdf_to_text_file(file_bytes):
-    pdf_file = BytesIO(file_bytes)
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
+# PDF reader of the document being extracted, set once per worker process.
+_worker_reader = None
+
+# Extraction workers are started fresh rather than forked from the server, so they do not
+# inherit its threads, held locks and open connections. The fork server imports this module
+# once, so each new pool's workers start without importing it again.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    PDF_MP_CONTEXT = multiprocessing.get_context("forkserver")
+    PDF_MP_CONTEXT.set_forkserver_preload([__name__])
+else:
+    PDF_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+def _init_extract_worker(file_bytes):
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(BytesIO(file_bytes))
+
+def _extract_page_range(start, stop):
+    """Extract pages [start, stop) in a worker process."""
+    return [_worker_reader.pages[page_num].extract_text() or "" for page_num in range(start, stop)]
+
+def iter_pdf_pages(file_bytes):
+    """
+    Yield (page_num, num_pages, text) for every page, in order. Large documents are
+    split into page ranges and extracted on a process pool; results still arrive in
+    page order as soon as each range is done.
+    """
+    pdf_reader = PyPDF2.PdfReader(BytesIO(file_bytes))
     num_pages = len(pdf_reader.pages)
-    text_output = ""
-    for page_num in range(num_pages):
-        page = pdf_reader.pages[page_num]
-        text = page.extract_text() or ""
-        text_output += text
-        if page_num < num_pages - 1:
-            text_output += f"\n\n--- Page {page_num + 1} ---\n\n"
+    if num_pages < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        for page_num in range(num_pages):
+            yield page_num, num_pages, pdf_reader.pages[page_num].extract_text() or ""
+        return
+    starts = range(0, num_pages, PDF_PAGES_PER_TASK)
+    stops = [min(start + PDF_PAGES_PER_TASK, num_pages) for start in starts]
+    # The PDF bytes are sent to each worker once, not with every task.
+    with ProcessPoolExecutor(max_workers=min(PDF_WORKERS, len(starts)), mp_context=PDF_MP_CONTEXT,
+                             initializer=_init_extract_worker, initargs=(file_bytes,)) as pool:
+        ranges = pool.map(_extract_page_range, starts, stops)
+        for start, texts in zip(starts, ranges):
+            for offset, text in enumerate(texts):
+                yield start + offset, num_pages, text
+
+def join_pages(pages):
+    """Join page texts with page markers in a single pass."""
+    parts = []
+    for page_num, text in enumerate(pages):
+        if page_num:
+            parts.append(f"\n\n--- Page {page_num} ---\n\n")
+        parts.append(text)
+    return "".join(parts)
+
+def extract_pdf_text_stream(file_bytes):
+    """
+    Generator that yields JSON log messages reporting extraction progress and returns
+    the extracted text (use `text = yield from extract_pdf_text_stream(...)`).
+    Extracted text is cached by file hash, so a repeat upload skips extraction.
+    """
+    key = None
+    if llm_cache is not None:
+        key = cache_key("pdf_text", hashlib.sha256(file_bytes).hexdigest())
+        cached = llm_cache.get(key)
+        metrics.cache_lookup("pdf_text", cached is not None)
+        if cached is not None:
+            yield json.dumps({"type": "log", "message": "Using cached PDF text."}) + "\n"
+            return cached
+    pages = []
+    elapsed = 0.0
+    start = time.perf_counter()
+    for page_num, num_pages, text in iter_pdf_pages(file_bytes):
+        pages.append(text)
+        # Only extraction counts, not the time the consumer holds each progress message.
+        elapsed += time.perf_counter() - start
+        yield json.dumps({"type": "log", "message": f"Extracted page {page_num + 1} of {num_pages}"}) + "\n"
+        start = time.perf_counter()
+    text_output = join_pages(pages)
+    metrics.PDF_EXTRACT_SECONDS.observe(elapsed)
+    if key is not None:
+        llm_cache.put(key, text_output)
     return text_output
 
-def ask_claude(prompt, question, api_key):
-    client = Anthropic(api_key=api_key)
-    full_message = f"{prompt}\n\nQuestion: {question}"
+def pdf_to_text_file(file_bytes):
+    stream = extract_pdf_text_stream(file_bytes)
+    while True:
+        try:
+            next(stream)
+        except StopIteration as done:
+            return done.value
+
+# One Anthropic client (and connection pool) per API key, shared across calls and threads.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key):
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = Anthropic(api_key=api_key)
+        return client
+
+def build_content(prompt, question, cache_question=False):
+    """
+    User message content for a call. Normally the prompt comes first, then the question.
+    With cache_question the (large, unchanging) question goes first as a cached block,
+    so it forms a stable prefix shared by every call that sends it.
+    """
+    if not cache_question:
+        return f"{prompt}\n\nQuestion: {question}"
+    return [
+        {"type": "text", "text": f"Paper:\n{question}", "cache_control": PAPER_CACHE_CONTROL},
+        {"type": "text", "text": prompt},
+    ]
+
+def _cached_reply(prompt, question, use_cache, cache_question):
+    """Look the call up in llm_cache. Returns (cache key or None, cached text or None)."""
+    if not use_cache or llm_cache is None:
+        return None, None
+    layout = ("cached_question",) if cache_question else ()
+    key = cache_key("message", MODEL_NAME, MAX_TOKENS, prompt, question, *layout)
+    cached = llm_cache.get(key)
+    metrics.cache_lookup("llm_message", cached is not None)
+    return key, cached
+
+def _record_usage(message, role):
+    usage = getattr(message, "usage", None)
+    if usage is None:
+        return
+    # input_tokens excludes tokens read from or written to the prompt cache.
+    for direction, tokens in (("input", usage.input_tokens),
+                              ("output", usage.output_tokens),
+                              ("cache_read", getattr(usage, "cache_read_input_tokens", None)),
+                              ("cache_write", getattr(usage, "cache_creation_input_tokens", None))):
+        if tokens:
+            metrics.LLM_TOKENS.inc(tokens, role=role, direction=direction)
+
+def ask_claude(prompt, question, api_key, use_cache=True, role="writer", cache_question=False):
+    """
+    Send one prompt to Claude and return the reply text (or ERROR_PREFIX + error).
+    `role` (writer, reviewer, prompt_improver, chunk_notes) labels the call's
+    timing and token metrics. cache_question sends the question as a prompt-cached
+    prefix (see build_content).
+    """
+    key, cached = _cached_reply(prompt, question, use_cache, cache_question)
+    if cached is not None:
+        return cached
+    client = get_client(api_key)
+    content = build_content(prompt, question, cache_question)
+    wait_start = time.perf_counter()
+    llm_rate_limiter.acquire()
     try:
-        message = client.messages.create(
-            model=MODEL_NAME,
-            max_tokens=MAX_TOKENS,
-            messages=[{"role": "user", "content": full_message}]
-        )
-        return message.content[0].text
+        with llm_slots:
+            call_start = time.perf_counter()
+            metrics.LLM_WAIT_SECONDS.observe(call_start - wait_start, role=role)
+            try:
+                message = client.messages.create(
+                    model=MODEL_NAME,
+                    max_tokens=MAX_TOKENS,
+                    messages=[{"role": "user", "content": content}]
+                )
+            finally:
+                metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - call_start, role=role)
     except Exception as e:
-        return f"Error occurred: {str(e)}"
+        metrics.LLM_ERRORS.inc(role=role)
+        return f"{ERROR_PREFIX}{str(e)}"
+    _record_usage(message, role)
+    text = message.content[0].text
+    if key is not None:
+        llm_cache.put(key, text)
+    return text
+
+def _stream_reply(client, content, role, wait_start, pieces, stop):
+    """
+    Run one streaming call for stream_claude on its own thread, putting each text piece
+    on `pieces` and finally a ("done", message) or ("error", exception) tuple. The call
+    holds an LLM slot only while it runs, however slowly the pieces are consumed, and
+    ends early once `stop` is set.
+    """
+    try:
+        with llm_slots:
+            call_start = time.perf_counter()
+            metrics.LLM_WAIT_SECONDS.observe(call_start - wait_start, role=role)
+            message = None
+            first = True
+            try:
+                with client.messages.stream(
+                    model=MODEL_NAME,
+                    max_tokens=MAX_TOKENS,
+                    messages=[{"role": "user", "content": content}]
+                ) as stream:
+                    for text in stream.text_stream:
+                        if first:
+                            metrics.LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - call_start, role=role)
+                            first = False
+                        pieces.put(text)
+                        if stop.is_set():
+                            break
+                    else:
+                        message = stream.get_final_message()
+            finally:
+                metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - call_start, role=role)
+    except Exception as e:
+        pieces.put(("error", e))
+        return
+    pieces.put(("done", message))
+
+def stream_claude(prompt, question, api_key, use_cache=True, role="writer", cache_question=False):
+    """
+    Streaming ask_claude, on the messages streaming API: a generator that yields the
+    reply text piece by piece as it is generated and returns the whole reply
+    (`text = yield from stream_claude(...)`). A cached reply is yielded in one piece.
+    Errors are returned as ERROR_PREFIX + error, as in ask_claude.
+    """
+    key, cached = _cached_reply(prompt, question, use_cache, cache_question)
+    if cached is not None:
+        yield cached
+        return cached
+    client = get_client(api_key)
+    content = build_content(prompt, question, cache_question)
+    wait_start = time.perf_counter()
+    llm_rate_limiter.acquire()
+    # The call runs on its own thread and buffers its pieces here, so a slow consumer of
+    # this generator does not hold an LLM slot.
+    pieces = queue.Queue()
+    stop = threading.Event()
+    threading.Thread(target=metrics.in_context(_stream_reply),
+                     args=(client, content, role, wait_start, pieces, stop), daemon=True).start()
+    parts = []
+    try:
+        while True:
+            piece = pieces.get()
+            if isinstance(piece, tuple):
+                break
+            parts.append(piece)
+            yield piece
+    finally:
+        # Reached the end, or the consumer closed this generator: end the call either way.
+        stop.set()
+    outcome, value = piece
+    if outcome == "error":
+        metrics.LLM_ERRORS.inc(role=role)
+        return f"{ERROR_PREFIX}{str(value)}"
+    _record_usage(value, role)
+    text = "".join(parts)
+    if key is not None:
+        llm_cache.put(key, text)
+    return text
 
 def parse_scores(response):
     try:
@@ -84,15 +365,45 @@ def parse_scores(response):
         print(f"Error parsing scores: {e}")
         return 0
 
-def improve_prompt(feedback1, feedback2, current_prompt, api_key):
+def review_summary(summary, api_key, reviewer_prompts=None, use_cache=True):
+    """
+    Ask every reviewer persona to score the summary, all at once on a thread pool.
+    Returns the list of review responses (in reviewer order) and their mean score.
+    """
+    reviewer_prompts = reviewer_prompts or REVIEWER_PROMPTS
+    with ThreadPoolExecutor(max_workers=len(reviewer_prompts)) as pool:
+        review = metrics.in_context(
+            lambda reviewer_prompt: ask_claude(reviewer_prompt, summary, api_key, use_cache, role="reviewer"))
+        reviews = list(pool.map(review, reviewer_prompts))
+    scores = [parse_scores(review) for review in reviews]
+    return reviews, sum(scores) / len(scores)
+
+NUMBER_WORDS = {1: "one", 2: "two", 3: "three", 4: "four", 5: "five"}
+
+def improve_prompt(feedbacks, current_prompt, api_key, use_cache=True, variant=1, variants=1, attempt=1):
+    """
+    Ask for an improved prompt that addresses the feedback. When several candidates are
+    requested at once (variants > 1), each variant after the first is asked to take a
+    different approach, which also gives it its own cache key. Likewise a repeated
+    attempt at improving the same prompt (attempt > 1) is numbered, so it is sampled
+    afresh instead of replayed from llm_cache.
+    """
+    reviewers = NUMBER_WORDS.get(len(feedbacks), str(len(feedbacks)))
+    feedback_sections = "".join(f"Feedback{i}:\n{feedback}\n\n" for i, feedback in enumerate(feedbacks, 1))
     prompt_improvement_request = (
-        "You are an expert prompt engineer. Given the following prompt which generates a blog post summary, and feedback from two physicians reading this blog post, please generate an improved version of the prompt that will address the critique:\n\n"
+        f"You are an expert prompt engineer. Given the following prompt which generates a blog post summary, and feedback from {reviewers} physicians reading this blog post, please generate an improved version of the prompt that will address the critique:\n\n"
         f"Original Prompt:\n{current_prompt}\n\n"
-        f"Feedback1:\n{feedback1}\n\n"
-        f"Feedback2:\n{feedback2}\n\n"
+        f"{feedback_sections}"
         "Please provide an improved version of the prompt that will generate a better blog post for between 500-800 words."
     )
-    return ask_claude("", prompt_improvement_request, api_key)
+    if variant > 1:
+        prompt_improvement_request += (
+            f"\n\nThis is candidate {variant} of {variants}. Address the critique in a different way "
+            "than the most obvious revision would.")
+    if attempt > 1:
+        prompt_improvement_request += (
+            f"\n\nThis is attempt {attempt}; earlier revisions of this prompt did not score higher.")
+    return ask_claude("", prompt_improvement_request, api_key, use_cache, role="prompt_improver")
 DESIRED_KEYWORD = "title"  # We'll search for "Title" (case-insensitive)
 
 def format_summary(text, iteration):
@@ -153,52 +464,272 @@ def format_summary(text, iteration):
         return f"Summary {iteration}:\n{bold_title}\n{remaining_text}"
     else:
         return f"Summary {iteration}:\n"
-def summarization_stream(pdf_text, api_key):
+# Section headings on a line of their own, optionally numbered ("2. Results", "METHODS").
+SECTION_HEADING = re.compile(
+    r"^[ \t]*(?:\d+(?:\.\d+)*\.?[ \t]+)?"
+    r"(abstract|introduction|background|methods|materials and methods|results|discussion|conclusions?"
+    r"|references|bibliography|acknowledge?ments?|supplementary (?:materials?|information|data)"
+    r"|author contributions|funding|competing interests|conflicts? of interest|data availability)"
+    r"[ \t]*:?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE)
+# Sections that add tokens but nothing a blog post needs.
+LOW_VALUE_SECTIONS = (
+    "references", "bibliography", "acknowledg", "supplementary", "author contributions",
+    "funding", "competing interests", "conflict", "data availability")
+PAGE_MARKER = re.compile(r"\n\n--- Page \d+ ---\n\n")
+
+CHUNK_PROMPT = (
+    "The following is one part of a scientific paper. Write concise notes on it for someone who will later write a blog post "
+    "about the whole paper: the key findings with their numbers, the methods in brief, and any clinical implications or "
+    "RNA markers mentioned. Keep names, numbers and statistics exact."
+)
+
+def split_sections(text):
+    """
+    Split paper text on recognised section headings. Returns (name, text) pairs; text
+    before the first heading (title, authors) is returned under the name "front".
+    """
+    sections = []
+    name = "front"
+    start = 0
+    for match in SECTION_HEADING.finditer(text):
+        sections.append((name, text[start:match.start()]))
+        name = match.group(1).lower()
+        start = match.start()
+    sections.append((name, text[start:]))
+    return [(name, body) for name, body in sections if body.strip()]
+
+def reduce_paper_text(pdf_text):
+    """Remove page markers and drop low-value sections such as references and acknowledgements."""
+    text = PAGE_MARKER.sub("\n", pdf_text)
+    kept = [body for name, body in split_sections(text)
+            if not name.startswith(LOW_VALUE_SECTIONS)]
+    return "".join(kept).strip()
+
+def chunk_text(text, max_chars=PAPER_CHUNK_CHARS):
+    """Pack paragraphs into chunks of at most max_chars, splitting oversized paragraphs."""
+    chunks = []
+    current = []
+    size = 0
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) > max_chars and current:
+            # Flush what is held first, so the slices below keep the paper's order.
+            chunks.append("\n\n".join(current))
+            current = []
+            size = 0
+        while len(paragraph) > max_chars:
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if size + len(paragraph) > max_chars and current:
+            chunks.append("\n\n".join(current))
+            current = []
+            size = 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def prepare_paper_text(pdf_text, api_key, use_cache=True):
+    """
+    Reduce the paper to what the writer needs. Low-value sections are dropped; if the
+    rest is still over INPUT_CHAR_BUDGET it is summarized chunk by chunk in parallel
+    (map) and the notes are joined (reduce), so generation input stays roughly
+    constant in size. Returns the text and a short description of what was done.
+    """
+    text = reduce_paper_text(pdf_text)
+    if len(text) <= INPUT_CHAR_BUDGET:
+        return text, f"Paper text reduced from {len(pdf_text)} to {len(text)} characters."
+    chunks = chunk_text(text)
+    with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks))) as pool:
+        notes = list(pool.map(metrics.in_context(
+            lambda chunk: ask_claude(CHUNK_PROMPT, chunk, api_key, use_cache, role="chunk_notes")), chunks))
+    merged = "\n\n".join(f"Notes on part {i} of {len(notes)}:\n{note}" for i, note in enumerate(notes, 1))
+    return merged, (f"Paper text reduced from {len(pdf_text)} to {len(text)} characters, "
+                    f"then condensed from {len(chunks)} chunks to {len(merged)} characters of notes.")
+
+def summarization_stream(pdf_text, api_key, use_cache=True, beam_width=None):
     """
     Run the summarization process on the given pdf_text and yield JSON messages in real time.
     Each JSON message has a "type" (e.g., "score", "blog", "prompt", or "log") and a "message".
     The blog messages are formatted using format_summary(), which removes any unwanted preamble
     and bolds the title (detected from the first occurrence of "Title") properly.
+    While a post is being written, "blog_delta" messages carry its raw text as it
+    arrives (with an "iteration" number); the formatted "blog" message follows when it is done.
+
+    Completed runs are cached by paper text and run settings; a repeat of the same paper
+    replays the stored messages instead of calling the API. use_cache=False skips both
+    the run cache and the per-call cache.
+
+    beam_width (default BEAM_WIDTH) above 1 searches several prompt candidates per
+    round (see _beam_search); their messages are labelled "<round>.<candidate>".
+    """
+    beam_width = BEAM_WIDTH if beam_width is None else beam_width
+    if not use_cache or llm_cache is None:
+        yield from _summarization_events(pdf_text, api_key, use_cache, {}, beam_width)
+        return
+    beam = ("beam", beam_width, BEAM_PATIENCE, BEAM_MIN_GAIN) if beam_width > 1 else ()
+    run_key = cache_key("run", MODEL_NAME, MAX_TOKENS, TARGET_SCORE, MAX_ITERATIONS, INITIAL_PROMPT,
+                        REVIEWER_PROMPTS, INPUT_CHAR_BUDGET, PAPER_CHUNK_CHARS, "cached_question", *beam, pdf_text)
+    cached = llm_cache.get(run_key)
+    metrics.cache_lookup("llm_run", cached is not None)
+    if cached is not None:
+        yield json.dumps({"type": "log", "message": "Replaying cached summarization run."}) + "\n"
+        yield from json.loads(cached)
+        return
+    events = []
+    state = {}
+    for event in _summarization_events(pdf_text, api_key, use_cache, state, beam_width):
+        # A replay only needs each finished blog post, not the deltas that built it.
+        if json.loads(event)["type"] != "blog_delta":
+            events.append(event)
+        yield event
+    # Runs that hit an API error are not worth replaying.
+    if not state.get("failed"):
+        llm_cache.put(run_key, json.dumps(events))
+
+def _failed(*responses):
+    return any(response.startswith(ERROR_PREFIX) for response in responses)
+
+def _stream_blog(prompt, txt_content, api_key, use_cache, iteration):
+    """
+    Generate one blog post, yielding blog_delta messages with the raw text as it is
+    written, and return the full text. The first piece is sent at once; after that,
+    pieces are batched into at most one message per BLOG_DELTA_INTERVAL.
     """
-    import json  # Ensure json is imported
+    stream = stream_claude(prompt, txt_content, api_key, use_cache, cache_question=True)
+    pending = []
+    last_sent = None
+    while True:
+        try:
+            pending.append(next(stream))
+        except StopIteration as done:
+            text = done.value
+            break
+        now = time.monotonic()
+        if last_sent is None or now - last_sent >= BLOG_DELTA_INTERVAL:
+            yield json.dumps({"type": "blog_delta", "iteration": iteration, "message": "".join(pending)}) + "\n"
+            pending = []
+            last_sent = now
+    if pending:
+        yield json.dumps({"type": "blog_delta", "iteration": iteration, "message": "".join(pending)}) + "\n"
+    return text
+
+def _beam_candidate(feedbacks, parent_prompt, txt_content, api_key, use_cache, variant, variants, attempt, stop):
+    """
+    Improve the parent prompt, then write and review a post with it. Returns (prompt, summary,
+    reviews, score), or None if `stop` is set first; it is checked before each call.
+    """
+    if stop.is_set():
+        return None
+    prompt = improve_prompt(feedbacks, parent_prompt, api_key, use_cache, variant=variant, variants=variants,
+                            attempt=attempt)
+    if stop.is_set():
+        return None
+    summary = ask_claude(prompt, txt_content, api_key, use_cache, cache_question=True)
+    if stop.is_set():
+        return None
+    reviews, score = review_summary(summary, api_key, use_cache=use_cache)
+    return prompt, summary, reviews, score
+
+def _beam_search(txt_content, api_key, use_cache, state, beam_width, prompt, reviews, score):
+    """
+    Rounds 2 to MAX_ITERATIONS of a beam search, starting from the first round's prompt,
+    reviews and score. Each round's candidates are improved from the best so far and
+    reported as they finish; a new best is sent as its blog post. A round that does not
+    replace the best prompt is followed by a fresh attempt from the same prompt; the run
+    stops after BEAM_PATIENCE rounds without a gain of BEAM_MIN_GAIN. Returns the best score.
+    """
+    best_prompt, best_reviews, best_score = prompt, reviews, score
+    iteration = 1
+    stale_rounds = 0
+    # Rounds improved from the current best prompt so far; restarts when it is replaced,
+    # even by a gain too small to reset stale_rounds.
+    attempt = 0
+    while best_score < TARGET_SCORE and iteration < MAX_ITERATIONS:
+        iteration += 1
+        round_start_score = best_score
+        round_parent = best_prompt
+        attempt += 1
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=min(BEAM_CONCURRENCY or beam_width, beam_width))
+        try:
+            futures = {pool.submit(metrics.in_context(_beam_candidate), best_reviews, best_prompt, txt_content,
+                                   api_key, use_cache, variant, beam_width, attempt, stop): variant
+                       for variant in range(1, beam_width + 1)}
+            for future in as_completed(futures):
+                label = f"{iteration}.{futures[future]}"
+                prompt, summary, reviews, score = future.result()
+                if _failed(prompt, summary, *reviews):
+                    state["failed"] = True
+                yield json.dumps({"type": "prompt", "message": f"Prompt {label}: {prompt}"}) + "\n"
+                yield json.dumps({"type": "score", "message": f"Score {label}: {score}"}) + "\n"
+                if score > best_score:
+                    best_prompt, best_reviews, best_score = prompt, reviews, score
+                    yield json.dumps({"type": "blog", "message": format_summary(summary, label)}) + "\n"
+                    if best_score >= TARGET_SCORE:
+                        yield json.dumps({"type": "log", "message": "Target score achieved!"}) + "\n"
+                        return best_score
+        finally:
+            # Once the target is reached (or the client is gone), candidates not yet started are
+            # cancelled and running ones stop after their current call, releasing their LLM slot.
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+        stale_rounds = stale_rounds + 1 if best_score - round_start_score < BEAM_MIN_GAIN else 0
+        if best_prompt != round_parent:
+            attempt = 0
+        if stale_rounds >= BEAM_PATIENCE:
+            yield json.dumps({"type": "log", "message": f"Score plateaued at {best_score} for "
+                                                        f"{stale_rounds} rounds; stopping."}) + "\n"
+            break
+    return best_score
+
+def _summarization_events(pdf_text, api_key, use_cache, state, beam_width=1):
+    """The refinement loop behind summarization_stream. Sets state["failed"] if any API call failed."""
     yield json.dumps({"type": "log", "message": "Running summarization process..."}) + "\n"
     
     # Set the initial prompt and yield it immediately.
     current_prompt = INITIAL_PROMPT
     yield json.dumps({"type": "prompt", "message": f"Prompt 1: {current_prompt}"}) + "\n"
     
-    txt_content = pdf_text
+    # Drop references and other back matter, condensing long papers, before the loop.
+    txt_content, reduction_message = prepare_paper_text(pdf_text, api_key, use_cache)
+    if ERROR_PREFIX in txt_content:
+        state["failed"] = True
+    yield json.dumps({"type": "log", "message": reduction_message}) + "\n"
     iteration = 1
 
-    # Generate the summary for iteration 1 and yield it.
-    current_summary = ask_claude(current_prompt, txt_content, api_key)
+    # Generate the summary for iteration 1, streaming it as it is written, then yield the
+    # formatted post. The paper text is the cached prefix of every writer call, so later
+    # iterations only pay for the new prompt.
+    current_summary = yield from _stream_blog(current_prompt, txt_content, api_key, use_cache, iteration)
     yield json.dumps({"type": "blog", "message": format_summary(current_summary, iteration)}) + "\n"
     
-    # Get review responses and calculate the initial score.
-    review_response_1 = ask_claude(REVIEWER_PROMPT_1, current_summary, api_key)
-    current_score_1 = parse_scores(review_response_1)
-    review_response_2 = ask_claude(REVIEWER_PROMPT_2, current_summary, api_key)
-    current_score_2 = parse_scores(review_response_2)
-    current_score = (current_score_1 + current_score_2) / 2
+    # Get review responses (in parallel) and calculate the initial score.
+    reviews, current_score = review_summary(current_summary, api_key, use_cache=use_cache)
+    if _failed(current_summary, *reviews):
+        state["failed"] = True
     yield json.dumps({"type": "score", "message": f"Score {iteration}: {current_score}"}) + "\n"
-    
+
+    if beam_width > 1:
+        current_score = yield from _beam_search(txt_content, api_key, use_cache, state, beam_width,
+                                                current_prompt, reviews, current_score)
+
     # Loop for subsequent iterations (iteration 2 and beyond) if needed.
-    while current_score < TARGET_SCORE and iteration < MAX_ITERATIONS:
+    while beam_width <= 1 and current_score < TARGET_SCORE and iteration < MAX_ITERATIONS:
         iteration += 1
         # Update the prompt using the feedback.
-        current_prompt = improve_prompt(review_response_1, review_response_2, current_prompt, api_key)
+        current_prompt = improve_prompt(reviews, current_prompt, api_key, use_cache)
         yield json.dumps({"type": "prompt", "message": f"Prompt {iteration}: {current_prompt}"}) + "\n"
         
         # Generate a new summary based on the updated prompt.
-        current_summary = ask_claude(current_prompt, txt_content, api_key)
+        current_summary = yield from _stream_blog(current_prompt, txt_content, api_key, use_cache, iteration)
         yield json.dumps({"type": "blog", "message": format_summary(current_summary, iteration)}) + "\n"
         
         # Recalculate review responses and new score.
-        review_response_1 = ask_claude(REVIEWER_PROMPT_1, current_summary, api_key)
-        current_score_1 = parse_scores(review_response_1)
-        review_response_2 = ask_claude(REVIEWER_PROMPT_2, current_summary, api_key)
-        current_score_2 = parse_scores(review_response_2)
-        current_score = (current_score_1 + current_score_2) / 2
+        reviews, current_score = review_summary(current_summary, api_key, use_cache=use_cache)
+        if _failed(current_prompt, current_summary, *reviews):
+            state["failed"] = True
         yield json.dumps({"type": "score", "message": f"Score {iteration}: {current_score}"}) + "\n"
         
         if current_score >= TARGET_SCORE: